@@ -0,0 +1,162 @@
+import os
+import random
+import argparse
+
+import fitz
+import pandas as pd
+
+from collections import Counter
+from docx import Document
+from pptx import Presentation
+from pptx.util import Inches
+
+#Words of the synthetic sentences, the processed corpus of a sentence is its words in lowercase
+WORDS = ['estudiante', 'universidad', 'proyecto', 'sistema', 'informacion', 'desarrollo', 'analisis', 'proceso', 'resultado', 'modelo',
+         'trabajo', 'investigacion', 'metodo', 'problema', 'solucion', 'datos', 'tecnologia', 'sociedad', 'economia', 'politica',
+         'historia', 'cultura', 'educacion', 'ciencia', 'conocimiento', 'aprendizaje', 'empresa', 'mercado', 'produccion', 'energia',
+         'ambiente', 'recurso', 'agua', 'ciudad', 'poblacion', 'salud', 'enfermedad', 'tratamiento', 'paciente', 'hospital',
+         'gobierno', 'ley', 'derecho', 'justicia', 'estado', 'nacion', 'region', 'territorio', 'frontera', 'comercio',
+         'lenguaje', 'texto', 'autor', 'obra', 'lectura', 'escritura', 'discurso', 'argumento', 'teoria', 'practica',
+         'analizar', 'desarrollar', 'proponer', 'explicar', 'describir', 'comparar', 'evaluar', 'aplicar', 'construir', 'generar',
+         'importante', 'necesario', 'posible', 'diferente', 'principal', 'general', 'social', 'economico', 'politico', 'cultural',
+         'nuevo', 'grande', 'actual', 'publico', 'privado', 'nacional', 'internacional', 'local', 'global', 'natural',
+         'red', 'computadora', 'programa', 'algoritmo', 'estructura', 'funcion', 'variable', 'valor', 'medida', 'calidad']
+
+NAMES = ['Juan', 'Maria', 'Lucia', 'Martin', 'Sofia', 'Diego', 'Valentina', 'Mateo', 'Camila', 'Nicolas']
+SURNAMES = ['Garcia', 'Rodriguez', 'Gonzalez', 'Fernandez', 'Lopez', 'Martinez', 'Perez', 'Gomez', 'Diaz', 'Romero']
+
+FORMATS = ['docx', 'pptx', 'pdf']
+
+
+def make_sentence(rng, length=(8, 16)):
+    """
+    Return a random sentence
+    """
+    words = rng.choices(WORDS, k=rng.randint(*length))
+    return ' '.join(words).capitalize()
+
+def make_corpus(rng, n_sentences, source=None, overlap=0.0):
+    """
+    Return a list of sentences where a share (overlap) of them is copied from the sentences of a source corpus.
+    One word of each copied sentence is changed, so it is similar but not an exact copy
+    """
+    corpus = [make_sentence(rng) for _ in range(n_sentences)]
+    if source:
+        for i in rng.sample(range(n_sentences), int(n_sentences * overlap)):
+            words = rng.choice(source).lower().split()
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            corpus[i] = ' '.join(words).capitalize()
+    return corpus
+
+def make_author(rng):
+    """
+    Return a random author name
+    """
+    return '{} {}'.format(rng.choice(NAMES), rng.choice(SURNAMES))
+
+#---Files-----------------------------------------------------------------------------------------------------------------------
+def write_docx(path, corpus, author):
+    """
+    Write a .docx file with the author and a paragraph every 5 sentences
+    """
+    document = Document()
+    document.add_paragraph('Nombre y apellido: {}'.format(author))
+    for i in range(0, len(corpus), 5):
+        document.add_paragraph('. '.join(corpus[i:i + 5]) + '.')
+    document.save(path)
+
+def write_pptx(path, corpus, author):
+    """
+    Write a .pptx file with the author in the first slide and 5 sentences in each slide
+    """
+    presentation = Presentation()
+    slide = presentation.slides.add_slide(presentation.slide_layouts[0])
+    slide.shapes.title.text = 'Nombre y apellido: {}'.format(author)
+
+    for i in range(0, len(corpus), 5):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        textbox = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(6))
+        textbox.text_frame.word_wrap = True
+        textbox.text_frame.text = '. '.join(corpus[i:i + 5]) + '.'
+    presentation.save(path)
+
+def write_pdf(path, corpus, author):
+    """
+    Write a .pdf file with the author and a paragraph every 5 sentences, 20 sentences in each page
+    """
+    pdf = fitz.open()
+    paragraphs = ['Nombre y apellido: {}'.format(author)] + ['. '.join(corpus[i:i + 5]) + '.' for i in range(0, len(corpus), 5)]
+
+    for i in range(0, len(paragraphs), 4):
+        page = pdf.new_page()
+        y = 50
+        for paragraph in paragraphs[i:i + 4]:
+            rect = fitz.Rect(50, y, page.rect.width - 50, y + 180)
+            page.insert_textbox(rect, paragraph, fontsize=10)
+            y += 180
+    pdf.save(path)
+    pdf.close()
+
+WRITERS = {'docx': write_docx, 'pptx': write_pptx, 'pdf': write_pdf}
+
+def make_submissions(path, n_files, n_sentences, overlap=0.3, formats=FORMATS, seed=0):
+    """
+    Write n_files submissions into a folder, cycling through the formats.
+    Each submission copies a share (overlap) of its sentences from a common source, so the submissions are similar to each other.
+    Return the paths of the files
+    """
+    rng = random.Random(seed)
+    source = make_corpus(rng, n_sentences)
+    os.makedirs(path, exist_ok=True)
+
+    paths = []
+    for i in range(n_files):
+        extension = formats[i % len(formats)]
+        file_path = os.path.join(path, 'submission_{:04d}.{}'.format(i, extension))
+        WRITERS[extension](file_path, make_corpus(rng, n_sentences, source, overlap), make_author(rng))
+        paths.append(file_path)
+
+    return paths
+
+#---Database rows---------------------------------------------------------------------------------------------------------------
+def make_row(rng, filename, corpus):
+    """
+    Return a processed document like the ones of the database. The lemmas of a sentence are its words in lowercase
+    """
+    lemmas = [sentence.lower().split() for sentence in corpus]
+    topic = [word for word, _ in Counter(word for sentence in lemmas for word in sentence).most_common(10)]
+    processed_corpus = [(i, ' '.join(sentence)) for i, sentence in enumerate(lemmas) if len(sentence) > 3]
+
+    return {'doc_id': '{:040x}'.format(rng.getrandbits(160)), 'filename': filename, 'author': [make_author(rng)],
+            'topic': topic, 'corpus': corpus, 'processed_corpus': processed_corpus}
+
+def make_database(n_docs, n_sentences, overlap=0.3, copied=0.1, seed=0):
+    """
+    Return a processed query document and a dataframe with n_docs processed documents of the database.
+    A share (copied) of the documents copies a share (overlap) of its sentences from the query document
+    """
+    rng = random.Random(seed)
+    query = make_row(rng, 'query', make_corpus(rng, n_sentences))
+
+    rows = []
+    for i in range(n_docs):
+        source = query['corpus'] if rng.random() < copied else None
+        rows.append(make_row(rng, 'document_{:06d}'.format(i), make_corpus(rng, n_sentences, source, overlap)))
+
+    return query, pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Write synthetic Spanish submissions with controlled overlap")
+
+    parser.add_argument("path", help="Folder for the submissions")
+    parser.add_argument("-f", "--files", type=int, default=12, help="Number of submissions (default: 12)")
+    parser.add_argument("-n", "--sentences", type=int, default=100, help="Number of sentences of each submission (default: 100)")
+    parser.add_argument("--overlap", type=float, default=0.3, help="Share of the sentences copied from a common source (default: 0.3)")
+    parser.add_argument("--formats", nargs='+', choices=FORMATS, default=FORMATS, help="Formats of the submissions (default: docx pptx pdf)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+
+    args = parser.parse_args()
+
+    make_submissions(args.path, args.files, args.sentences, args.overlap, args.formats, args.seed)
@@ -0,0 +1,41 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from reader import read_file
+
+
+def benchmark_pdf_readers(paths, repeat=3):
+    """
+    Time reading each pdf file directly and converting it to .docx first.
+    Return the best time of each reader for each file and the size of the extracted text
+    """
+    results = []
+    for path in paths:
+        result = {'file': path}
+        for pdf_reader in ['native', 'docx']:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                df = read_file(path, pdf_reader)
+                times.append(time.perf_counter() - start)
+            result[pdf_reader] = {'seconds': min(times), 'characters': len(df['text'][0])}
+        result['speedup'] = result['docx']['seconds'] / result['native']['seconds']
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare the native pdf reader with the pdf2docx conversion")
+
+    parser.add_argument("paths", nargs='+', help="Paths to the .pdf files")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of times each file is read (default: 3)")
+
+    args = parser.parse_args()
+
+    print(json.dumps(benchmark_pdf_readers(args.paths, args.repeat), indent=4))
@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+#Modules imported before checking a file, none of them should load the model or the data
+MODULES = ['detection', 'reader', 'processor', 'similarity', 'topic', 'author', 'database', 'vectors']
+
+
+def time_command(command, repeat=3):
+    """
+    Run a command in a new python process and return its best time in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + command, cwd=ROOT_PATH, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def benchmark_startup(repeat=3):
+    """
+    Time the command line help and the import of the modules of the pipeline, each one in a new process
+    """
+    results = {'help': time_command(['plagiarism_detection.py', '--help'], repeat)}
+    for module in MODULES:
+        results[module] = time_command(['-c', 'import sys; sys.path.insert(0, "src"); import {}'.format(module)], repeat)
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Time the startup of the command line and the import of the pipeline")
+
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of times each command is run (default: 3)")
+    parser.add_argument("--budget", type=float, default=None, help="Fail if the import of the pipeline takes more seconds than this")
+
+    args = parser.parse_args()
+
+    results = benchmark_startup(args.repeat)
+    print(json.dumps(results, indent=4))
+
+    if args.budget is not None and results['detection'] > args.budget:
+        sys.exit('Startup over budget: {:.2f}s > {:.2f}s'.format(results['detection'], args.budget))
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+ROOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT_PATH, 'src'))
+
+from helper import pd
+from generator import make_submissions, make_database, FORMATS
+from reader import read_file, read_path
+from processor import processing_pipeline
+from topic import similar_topics
+from similarity import db_similarities
+from vectors import store_vectors, read_vectors
+from index import TopicIndex
+from lsh import store_lsh
+from registry import get_vocabulary, get_lemma_cache, reset
+from vocabulary import token_corpus
+
+STAGES = ['read', 'processing_pipeline', 'similar_topics', 'db_similarities', 'lsh']
+
+
+def measure(function, repeat=3, setup=None):
+    """
+    Run a function repeat times and once more tracing its memory, calling setup before each run without timing it.
+    Return the best and the first time in seconds, the peak of the traced memory in MB and the result of the function
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': min(times), 'first_seconds': times[0], 'peak_memory_mb': peak / 2**20}, result
+
+def benchmark_read(path, n_files, n_sentences, workers=None, repeat=3):
+    """
+    Time reading the submissions of each format one by one, and all of them with read_path
+    """
+    paths = make_submissions(path, n_files, n_sentences)
+    results = []
+
+    for extension in FORMATS:
+        files = [file for file in paths if file.endswith(extension)]
+        metrics, _ = measure(lambda: [read_file(file) for file in files], repeat)
+        results.append(dict(metrics, stage='read_file', format=extension, doc_size=n_sentences, documents=len(files), documents_per_second=len(files) / metrics['seconds']))
+
+    metrics, df = measure(lambda: read_path(path, workers), repeat)
+    results.append(dict(metrics, stage='read_path', doc_size=n_sentences, documents=len(paths), documents_per_second=len(paths) / metrics['seconds']))
+
+    return results, df
+
+def benchmark_processing(df, repeat=3):
+    """
+    Time processing the read submissions with an empty lemma cache, so every run parses every sentence,
+    and with the lemmas of every sentence in the cache
+    """
+    results = []
+
+    for name, setup in [('cold', lambda: get_lemma_cache().clear()), ('cached', None)]:
+        metrics, processed = measure(lambda: processing_pipeline(df.copy()), repeat, setup)
+        sentences = sum(len(corpus) for corpus in processed['corpus'])
+        results.append(dict(metrics, stage='processing_pipeline', method=name, documents=len(df), sentences=sentences,
+                            documents_per_second=len(df) / metrics['seconds'], sentences_per_second=sentences / metrics['seconds']))
+
+    return results
+
+def benchmark_topics(query, db, closeness=3, repeat=3):
+    """
+    Time filtering the database by topic with the topic index and comparing every document
+    """
+    index = TopicIndex()
+    index.add(list(db['doc_id']), list(db['topic']))
+    results = []
+
+    for name, comparing_df in [('index', db), ('scan', db.drop(columns='doc_id'))]:
+        metrics, filtered = measure(lambda: similar_topics(query, comparing_df, closeness, index), repeat)
+        results.append(dict(metrics, stage='similar_topics', method=name, db_size=len(db), candidates=len(filtered), documents_per_second=len(db) / metrics['seconds']))
+
+    return results
+
+def benchmark_similarities(query, db, threshold=0.7, repeat=3):
+    """
+    Time scoring the sentences of the query document against the stored vectors of the database
+    """
+    store_vectors(db)
+    vectors = read_vectors()
+    pairs = len(query['processed_corpus']) * sum(len(processed_corpus) for processed_corpus in db['processed_corpus'])
+
+    metrics, similarities = measure(lambda: db_similarities(query, db, {}, threshold, vectors), repeat)
+    return [dict(metrics, stage='db_similarities', db_size=len(db), doc_size=len(query['corpus']), sentence_pairs=pairs,
+                 matched_sentences=len(similarities), documents_per_second=len(db) / metrics['seconds'], pairs_per_second=pairs / metrics['seconds'])]
+
+def benchmark_lsh(query, db, threshold=0.7, bands=(5, 10, 20), repeat=3):
+    """
+    Time scoring the query document only against the candidates of the LSH index with each number of bands,
+    and measure the recall of the matches against scoring every sentence
+    """
+    store_vectors(db)
+    store_lsh(db)
+    vectors = read_vectors()
+
+    def matches(similarities):
+        return {(sentence, plagiarism['plagiarized_file'], plagiarism['plagiarized_sentence']) for sentence, value in similarities.items() for plagiarism in value['plagiarism']}
+
+    metrics, similarities = measure(lambda: db_similarities(query, db, {}, threshold, vectors), repeat)
+    exact = matches(similarities)
+    results = [dict(metrics, stage='lsh', method='brute_force', db_size=len(db), doc_size=len(query['corpus']), matches=len(exact), recall=1.0)]
+
+    for n_bands in bands:
+        metrics, similarities = measure(lambda: db_similarities(query, db, {}, threshold, vectors, n_bands), repeat)
+        found = matches(similarities)
+        results.append(dict(metrics, stage='lsh', method='bands_{}'.format(n_bands), db_size=len(db), doc_size=len(query['corpus']),
+                            matches=len(found), recall=len(found & exact) / max(len(exact), 1), speedup=results[0]['seconds'] / metrics['seconds']))
+
+    return results
+
+def run_benchmarks(db_sizes, doc_sizes, n_files=12, stages=STAGES, workers=None, repeat=3):
+    """
+    Run the benchmarks of the stages at each database and document size, in a temporary folder
+    so the database, vectors, index and caches of the benchmark do not mix with the real ones
+    """
+    results = []
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        os.chdir(temp_folder)
+        reset(keep=['nlp'])
+        try:
+            for doc_size in doc_sizes:
+                if 'read' in stages or 'processing_pipeline' in stages:
+                    read_results, df = benchmark_read(os.path.join(temp_folder, 'submissions_{}'.format(doc_size)), n_files, doc_size, workers, repeat)
+                    if 'read' in stages:
+                        results += read_results
+                    if 'processing_pipeline' in stages:
+                        try:
+                            results += [dict(result, doc_size=doc_size) for result in benchmark_processing(df, repeat)]
+                        except OSError as error:
+                            results.append({'stage': 'processing_pipeline', 'doc_size': doc_size, 'error': str(error)})
+
+                for db_size in db_sizes:
+                    #Each size gets its own index and vectors store
+                    os.chdir(temp_folder)
+                    os.makedirs('{}_{}'.format(db_size, doc_size))
+                    os.chdir('{}_{}'.format(db_size, doc_size))
+
+                    #The indexes, the vocabulary and the caches are opened again in the new folder, only the model is kept
+                    reset(keep=['nlp'])
+
+                    #The processed corpora are encoded with the lemma ids, as they are read from the database
+                    query, db = make_database(db_size, doc_size)
+                    query['processed_corpus'] = token_corpus(query['processed_corpus'], get_vocabulary())
+                    db['processed_corpus'] = [token_corpus(processed_corpus, get_vocabulary(), persist=True) for processed_corpus in db['processed_corpus']]
+                    query = pd.Series(query)
+
+                    if 'similar_topics' in stages:
+                        results += [dict(result, doc_size=doc_size) for result in benchmark_topics(query, db, repeat=repeat)]
+                    if 'db_similarities' in stages:
+                        results += benchmark_similarities(query, db, repeat=repeat)
+                    if 'lsh' in stages:
+                        results += benchmark_lsh(query, db, repeat=repeat)
+        finally:
+            os.chdir(cwd)
+            reset(keep=['nlp'])
+
+    return results
+
+def get_commit():
+    """
+    Return the current commit of the repository, or None if it is not a git repository
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_PATH, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_reports(old, new):
+    """
+    Return the time of each benchmark of a new report divided by its time in an old report
+    """
+    def key(result):
+        return tuple(str(result.get(name)) for name in ['stage', 'format', 'method', 'db_size', 'doc_size'])
+
+    old_results = {key(result): result for result in old['results'] if 'seconds' in result}
+    return [dict(zip(['stage', 'format', 'method', 'db_size', 'doc_size'], key(result)), ratio=result['seconds'] / old_results[key(result)]['seconds'])
+            for result in new['results'] if 'seconds' in result and key(result) in old_results]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Time the stages of the plagiarism detection with synthetic submissions and databases")
+
+    parser.add_argument("-d", "--db_sizes", type=int, nargs='+', default=[100, 1000], help="Numbers of documents of the database (default: 100 1000)")
+    parser.add_argument("-n", "--doc_sizes", type=int, nargs='+', default=[50, 200], help="Numbers of sentences of each document (default: 50 200)")
+    parser.add_argument("-f", "--files", type=int, default=12, help="Number of submissions read and processed (default: 12)")
+    parser.add_argument("-s", "--stages", nargs='+', choices=STAGES, default=STAGES, help="Stages to time (default: all)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of processes reading the submissions (default: number of CPUs)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of times each stage is run (default: 3)")
+    parser.add_argument("-o", "--output", type=str, default='benchmark.json', help="Path to the json report (default: benchmark.json)")
+    parser.add_argument("--compare", type=str, default=None, help="Path to an older json report to compare the times with")
+
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    report = {'commit': get_commit(), 'python': platform.python_version(), 'platform': platform.platform(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'results': run_benchmarks(args.db_sizes, args.doc_sizes, args.files, args.stages, args.workers, args.repeat)}
+
+    with open(output, 'w') as report_file:
+        json.dump(report, report_file, indent=4)
+
+    if args.compare:
+        with open(args.compare) as old_file:
+            print(json.dumps(compare_reports(json.load(old_file), report), indent=4))
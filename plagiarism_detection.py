@@ -1,89 +1,97 @@
+import os
+import sys
 import argparse
-import json
 
-from src.reader import read_file, read_path, read_database
-from src.processor import processing_pipeline
-from src.similarity import get_similarities
-from src.topic import similar_topics
-from src.helper import merge_dataframes
-
-
-database = True 
-threshold = 0.7 
-closeness = 3
-store = False
-comparing_path = ''
+#The modules of src import each other by name
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
 
 
 def validate_threshold(value):
+    value = float(value)
     if 0 <= value <= 1:
         return value
     raise argparse.ArgumentTypeError("Threshold must be between 0 and 1")
 
 def validate_closeness(value):
+    value = int(value)
     if 0 <= value <= 10:
         return value
     raise argparse.ArgumentTypeError("Closeness must be between 0 and 10")
 
+def validate_bands(value):
+    value = int(value)
+    if 1 <= value <= 20:
+        return value
+    raise argparse.ArgumentTypeError("LSH bands must be between 1 and 20")
 
-def plagiarism_detection(file_path):
-    """
-    Receive a file path and return a json with the similarities.
-    """
-
-    #Read the file and store it in a dataframe
-    file = read_file(file_path)
-
-    #If comparing_path is not empty, read the files from the path and store them in a dataframe
-    if comparing_path:
-        comparing_files = read_path(comparing_path)
-        comparing_files.apply(processing_pipeline)
-
-        #If database is True, read the database and merge it with the comparing files
-        if database:
-            comparing_files = merge_dataframes(comparing_files, read_database())
-
-    #If comparing_path is empty and database is True, read the database and store it in a dataframe        
-    elif database:
-        comparing_files = read_database()
-    
-    else:
-        raise Exception('No files to compare')
-    
-
-    file.apply(processing_pipeline)
-
-    #If store is True, update the database with comparing files
-    if store:
-        comparing_files.to_csv('./data.csv', index=False)
-
-    #Keep only the files with similar topics
-    comparing_files = similar_topics(file, comparing_files)
-
-    #Get the similarities between the file and the comparing files
-    similarities = get_similarities(file, comparing_files)
-
-    with open('results.json', 'w') as results_file:
-        json.dump(similarities, results_file, indent=4, sort_keys=True)
-
+def validate_top_k(value):
+    value = int(value)
+    if value >= 1:
+        return value
+    raise argparse.ArgumentTypeError("Top k must be at least 1")
 
-if __name__ == "__main__":
 
+def get_parser():
+    """
+    Return the parser of the command line arguments
+    """
     parser = argparse.ArgumentParser(description="Plagiarism Detector")
 
-    parser.add_argument("file_path", help="Path to the file to be analyzed")
+    parser.add_argument("file_path", nargs='?', default='', help="Path to the file to be analyzed, or to the folder with --cohort")
     parser.add_argument("-p", "--comparing_path",type=str, default='', help="Path to the files to be compared with the analyzed file")
     parser.add_argument("-db", "--database", type=bool, default=True, help="Use files from the database to compare (default: True)")
     parser.add_argument("-t", "--threshold", type=validate_threshold, default=0.7, help="Similarity threshold (default: 0.7)")
-    parser.add_argument("-n", "--closeness", type=int, default=3, help="Closeness between topics (default: 0.7)")
-    parser.add_argument("-s", "--store", type=bool, default=False, help="Store the used file in the database (default: False)")
+    parser.add_argument("-n", "--closeness", type=validate_closeness, default=3, help="Closeness between topics (default: 3)")
+    parser.add_argument("-s", "--store", type=bool, default=False, help="Store the used files in the database (default: False)")
+    parser.add_argument("-b", "--batch_size", type=int, default=256, help="Number of texts parsed together by spaCy (default: 256)")
+    parser.add_argument("-j", "--n_process", type=int, default=1, help="Number of processes used by spaCy (default: 1)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of processes reading the compared files (default: number of CPUs)")
+    parser.add_argument("-c", "--cohort", action="store_true", help="Compare every file of the folder in file_path with the others and the database")
+    parser.add_argument("-o", "--output_path", type=str, default='./results/', help="Folder for the results of each file in cohort mode (default: ./results/)")
+    parser.add_argument("--serve", action="store_true", help="Run a local HTTP server which keeps the model and the database loaded, file_path is ignored")
+    parser.add_argument("--host", type=str, default='127.0.0.1', help="Host of the server (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port of the server (default: 8000)")
+    parser.add_argument("--server_workers", type=int, default=2, help="Number of checks the server runs at the same time (default: 2)")
+    parser.add_argument("--pdf_reader", choices=['native', 'docx'], default='native', help="Read .pdf files directly or converting them to .docx (default: native)")
+    parser.add_argument("--stream", action="store_true", help="Write a JSON line for each sentence with similarities as soon as it is scored, into results.jsonl (default: False)")
+    parser.add_argument("-k", "--top_k", type=validate_top_k, default=None, help="With --stream, keep only the k highest scores of each line. A sentence gets a line for the database and one for each group of websites (citations, googled topic), so it can keep up to k scores in each of them (default: all)")
+    parser.add_argument("--shard", type=str, default=None, help="Shard where the files are stored with --store, e.g. a course or a year (default: by document id)")
+    parser.add_argument("--shards", nargs='+', default=None, help="Compare only with the documents of these shards of the database (default: all)")
+    parser.add_argument("--shard_workers", type=int, default=None, help="Score the shards of the database in this number of processes, one shard at a time in each. With --stream, the lines of the database are written once every shard is scored (default: read the database in one process)")
+    parser.add_argument("--fingerprint_overlap", type=validate_threshold, default=None, help="Compare only with the files sharing at least this share of the winnowed fingerprints of the analyzed file (default: all files)")
+    parser.add_argument("--lsh_bands", type=validate_bands, default=None, help="Score only the stored sentences sharing an LSH bucket with each sentence in the first bands (1 to 20, more bands give more recall). Scores every sentence if not set (default: None)")
+    parser.add_argument("--score_floor", type=validate_threshold, default=None, help="Cache the scores with the database down to this threshold, so later checks of the same files with a threshold down to it only filter them (default: the threshold)")
+    parser.add_argument("--profile", action="store_true", help="Write the time and counts of each stage and the cache hit rates next to the results, as results.metrics.json or cohort.metrics.json, or as a line of serve.metrics.jsonl for each check in --serve mode")
+    parser.add_argument("--profile_dump", type=str, default=None, help="Path to write a cProfile dump of the run")
+
+    return parser
 
-    args = parser.parse_args()
 
-    database = args.database
-    threshold = args.threshold
-    closeness = args.closeness
-    store = args.store
-    comparing_path = args.comparing_path
+if __name__ == "__main__":
+
+    parser = get_parser()
+    args = parser.parse_args()
 
-    plagiarism_detection(args.file_path)
\ No newline at end of file
+    if not args.serve and not args.file_path:
+        parser.error("the following arguments are required: file_path")
+
+    #The pipeline is imported only once the arguments are valid, and the model and the data are loaded when first used
+    sys.path.insert(0, SRC_PATH)
+    from detection import plagiarism_detection, cohort_detection, serve_detection
+
+    if args.profile_dump:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        if args.serve:
+            serve_detection(args)
+        elif args.cohort:
+            cohort_detection(args.file_path, args)
+        else:
+            plagiarism_detection(args.file_path, args)
+    finally:
+        if args.profile_dump:
+            profiler.disable()
+            profiler.dump_stats(args.profile_dump)
@@ -1,4 +1,5 @@
-from helper import pd, np, nlp, author_synonyms
+from helper import pd, np, author_synonyms, BATCH_SIZE, N_PROCESS
+from registry import get_nlp
 
 stop_author = ['legajo', 'email', 'mail', 'correo electronico', 'e-mail']
 
@@ -47,44 +48,60 @@ def slice_string(string, author_synonyms):
         i +=1
     return ' '.join(string)
 
-def get_author(string, headers):
+def get_authors(strings, headers, batch_size=BATCH_SIZE, n_process=N_PROCESS):
     """
-    Look for authors in a documents and return a list of them.
-    If it has trouble finding the author, it a list of first contiguos persons entities.
-    Also if there are not any persons entities, it returns np.nan
+    Look for the authors of a list of documents and return a list with a list of authors for each one.
+    The texts are parsed in batches and only the headers of the documents without author synonyms are parsed.
+    If there are not any author synonyms nor headers, the author of the document is np.nan
     """
-    string = slice_string(string, author_synonyms)
-    author = [] 
-    doc = nlp(string)
-    author_synonyms = [author for author in author_synonyms if author in doc.text.lower()]
+    strings = [slice_string(string, author_synonyms) for string in strings]
+    nlp = get_nlp()
+    docs = nlp.pipe(strings, batch_size=batch_size, n_process=n_process, disable=['parser'])
+    authors = [get_author(doc) for doc in docs]
 
-    for i,token in enumerate(doc):
+    #If there are not any author synonyms and headers is not empty, look into headers the first contiguos persons
+    without_author = [i for i, author in enumerate(authors) if author is None and not (type(headers[i]) == float and pd.isna(headers[i]))]
+    header_docs = nlp.pipe([header for i in without_author for header in headers[i]], batch_size=batch_size, n_process=n_process, disable=['parser'])
 
-        #If there is any author synonym, look for the first contiguos persons before it
+    for i in without_author:
+        authors[i] = []
+        for _ in headers[i]:
+            authors[i] += get_header_author(next(header_docs))
+
+    return [np.nan if author is None else author for author in authors]
+
+def get_author(doc):
+    """
+    Look for authors in a parsed document and return a list of them, the first contiguos persons entities after an author synonym.
+    If there are not any author synonyms, it returns None
+    """
+    for i, token in enumerate(doc):
+
+        #If there is any author synonym, look for the first contiguos persons after it
         if token.text.lower() in author_synonyms:
-            sliced_doc = doc[i+1:]
-            doc_list = [doc for doc in sliced_doc if (doc.text.lower() not in stop_author) and not(doc.pos_ == 'PUNCT' or doc.pos_ == 'SPACE')]
-            index = first_contiguos_persons(doc_list)
-            author += [doc.text for doc in doc_list[index[0]:index[1]]]
+            return persons_after(doc, i)
+
+    return None
+
+def get_header_author(doc):
+    """
+    Look for authors in a parsed header and return a list of them
+    """
+    author = []
+    for i, token in enumerate(doc):
+
+        #If there is any author synonym, look for the first contiguos persons after it
+        if token.text.lower() in author_synonyms:
+            author += persons_after(doc, i)
 
-            return author
-    
-    #If there are not any author synonyms and headers is not empty, look into haeders the first contiguos persons
-    if author == [] and not (type(headers) == float and pd.isna(headers)):
-        
-        for header in headers:
-            doc = nlp(header)
-
-            for i, token in enumerate(doc):
-                
-                #If there is any author synonym, look for the first contiguos persons before it
-                if token.text.lower() in author_synonyms:
-                    doc = doc[i+1:]
-                    doc_list = [token for token in doc if (doc.text.lower() not in stop_author) and not(doc.pos_ == 'PUNCT' or doc.pos_ == 'SPACE')]
-                    index = first_contiguos_persons(doc_list)
-                    author += [doc.text for doc in doc_list[index[0]:index[1]]]
-
-    elif author == []:
-        author = np.nan
-    
     return author
+
+def persons_after(doc, i):
+    """
+    Return the text of the first contiguos persons entities after the i-th token of a parsed document
+    """
+    sliced_doc = doc[i+1:]
+    doc_list = [token for token in sliced_doc if (token.text.lower() not in stop_author) and not(token.pos_ == 'PUNCT' or token.pos_ == 'SPACE')]
+    index = first_contiguos_persons(doc_list)
+
+    return [token.text for token in doc_list[index[0]:index[1]]]
@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+CACHE_PATH = './cache/'
+
+
+class LemmaCache:
+    """
+    Cache from a cleaned sentence to its lemmas, kept in memory (LRU) and on disk (sqlite).
+    The entries are keyed by the spacy model name and version, so changing the model does not reuse old lemmas
+    """
+
+    def __init__(self, nlp, path=CACHE_PATH, maxsize=100000):
+        self.model = '{}_{}-{}'.format(nlp.meta.get('lang'), nlp.meta.get('name'), nlp.meta.get('version'))
+        self.path = path
+        self.maxsize = maxsize
+        self.memory = OrderedDict()
+        self.connection = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'lemmas.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS lemmas (model TEXT, key TEXT, lemmas TEXT, PRIMARY KEY (model, key))')
+        return self.connection
+
+    def get(self, sentences):
+        """
+        Return a list with the cached lemmas of each sentence, or None if the sentence is not cached
+        """
+        keys = [sentence_key(sentence) for sentence in sentences]
+        lemmas = {}
+
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    lemmas[key] = self.memory[key]
+
+            #Look on disk for the sentences which are not in memory
+            missing = list(set(key for key in keys if key not in lemmas))
+            connection = self.connect()
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                query = 'SELECT key, lemmas FROM lemmas WHERE model = ? AND key IN ({})'.format(','.join('?' * len(chunk)))
+                for key, value in connection.execute(query, [self.model] + chunk):
+                    lemmas[key] = json.loads(value)
+                    self.remember(key, lemmas[key])
+
+            result = [lemmas.get(key) for key in keys]
+            self.hits += sum(1 for value in result if value is not None)
+            self.misses += sum(1 for value in result if value is None)
+
+        return result
+
+    def set(self, sentences, lemmas):
+        """
+        Cache the lemmas of each sentence
+        """
+        rows = [(self.model, sentence_key(sentence), json.dumps(value)) for sentence, value in zip(sentences, lemmas)]
+
+        with self.lock:
+            for _, key, value in rows:
+                self.remember(key, json.loads(value))
+            connection = self.connect()
+            with connection:
+                connection.executemany('INSERT OR REPLACE INTO lemmas VALUES (?, ?, ?)', rows)
+
+    def clear(self):
+        """
+        Forget the lemmas of every sentence parsed with the model, in memory and on disk
+        """
+        with self.lock:
+            self.memory.clear()
+            connection = self.connect()
+            with connection:
+                connection.execute('DELETE FROM lemmas WHERE model = ?', (self.model,))
+
+    def remember(self, key, value):
+        """
+        Keep an entry in memory, removing the least recently used one if the cache is full
+        """
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        """
+        Return the number of hits and misses and the hit rate
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+
+def sentence_key(sentence):
+    """
+    Return the key of a sentence, a hash of its text
+    """
+    return hashlib.sha1(sentence.encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """
+    Cache of processed web pages keyed by URL, stored on disk (sqlite).
+    Each page keeps its validators (ETag, Last-Modified and a hash of the content). A page is fresh during ttl seconds,
+    and when the pages take more than max_bytes the least recently used ones are removed
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=7 * 24 * 3600, max_bytes=500 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.connection = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'pages.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT, corpus TEXT, processed_corpus TEXT, fetched_at REAL, accessed_at REAL, size INTEGER)')
+        return self.connection
+
+    def get(self, urls):
+        """
+        Return a dictionary with the cached pages of the URLs. Each page has its validators, corpus,
+        processed corpus and whether it is still fresh
+        """
+        pages = {}
+        now = time.time()
+
+        with self.lock:
+            connection = self.connect()
+            for url in urls:
+                row = connection.execute('SELECT etag, last_modified, content_hash, corpus, processed_corpus, fetched_at FROM pages WHERE url = ?', (url,)).fetchone()
+                if row is None:
+                    continue
+                etag, last_modified, content_hash, corpus, processed_corpus, fetched_at = row
+                pages[url] = {'etag': etag, 'last_modified': last_modified, 'content_hash': content_hash,
+                              'corpus': json.loads(corpus), 'processed_corpus': [tuple(slice) for slice in json.loads(processed_corpus)],
+                              'fresh': now - fetched_at < self.ttl}
+            with connection:
+                connection.executemany('UPDATE pages SET accessed_at = ? WHERE url = ?', [(now, url) for url in pages])
+
+            self.hits += sum(1 for page in pages.values() if page['fresh'])
+            self.misses += sum(1 for url in urls if url not in pages or not pages[url]['fresh'])
+
+        return pages
+
+    def validators(self, pages, urls):
+        """
+        Return a dictionary with the conditional request headers of each cached URL
+        """
+        headers = {}
+        for url in urls:
+            if url not in pages:
+                continue
+            headers[url] = {}
+            if pages[url]['etag']:
+                headers[url]['If-None-Match'] = pages[url]['etag']
+            if pages[url]['last_modified']:
+                headers[url]['If-Modified-Since'] = pages[url]['last_modified']
+        return headers
+
+    def set(self, url, etag, last_modified, content_hash, corpus, processed_corpus):
+        """
+        Cache a processed page, as fetched now, and remove the least recently used pages if the cache is full
+        """
+        corpus = json.dumps(corpus)
+        processed_corpus = json.dumps(processed_corpus)
+        now = time.time()
+
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (url, etag, last_modified, content_hash, corpus, processed_corpus, now, now, len(corpus) + len(processed_corpus)))
+                self.evict(connection)
+
+    def refresh(self, url, etag=None, last_modified=None):
+        """
+        Mark a cached page as fetched now, when the server says it did not change
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('UPDATE pages SET fetched_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?',
+                                   (time.time(), etag, last_modified, url))
+
+    def evict(self, connection):
+        """
+        Remove the least recently used pages until the cache takes less than max_bytes
+        """
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+        for url, size in connection.execute('SELECT url, size FROM pages ORDER BY accessed_at').fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute('DELETE FROM pages WHERE url = ?', (url,))
+            total -= size
+
+    def stats(self):
+        """
+        Return the number of hits and misses and the hit rate
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+
+class SearchCache:
+    """
+    Cache of the URLs found by each search, keyed by the query, stored on disk (sqlite).
+    A search is fresh during ttl seconds, so checking the same topic again does not search it again
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=7 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.connection = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'searches.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS searches (query TEXT PRIMARY KEY, urls TEXT, searched_at REAL)')
+        return self.connection
+
+    def get(self, query):
+        """
+        Return the URLs found by a query if it is still fresh, or None
+        """
+        with self.lock:
+            row = self.connect().execute('SELECT urls, searched_at FROM searches WHERE query = ?', (query,)).fetchone()
+            if row is None or time.time() - row[1] >= self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, query, urls):
+        """
+        Cache the URLs found by a query, as searched now
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO searches VALUES (?, ?, ?)', (query, json.dumps(urls), time.time()))
+
+    def stats(self):
+        """
+        Return the number of hits and misses and the hit rate
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+
+class DocumentCache:
+    """
+    Cache of processed documents keyed by the hash of the content of the file and the version of the processing pipeline,
+    stored on disk (sqlite). Changing a file or the pipeline gives a new key, so the old entry is not reused
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'documents.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, document TEXT, accessed_at REAL)')
+        return self.connection
+
+    def get(self, keys):
+        """
+        Return a dictionary with the cached document of each key which is cached
+        """
+        documents = {}
+
+        with self.lock:
+            connection = self.connect()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                query = 'SELECT key, document FROM documents WHERE key IN ({})'.format(','.join('?' * len(chunk)))
+                for key, document in connection.execute(query, chunk):
+                    documents[key] = json.loads(document)
+            with connection:
+                connection.executemany('UPDATE documents SET accessed_at = ? WHERE key = ?', [(time.time(), key) for key in documents])
+
+            self.hits += len(documents)
+            self.misses += len(keys) - len(documents)
+
+        return documents
+
+    def set(self, key, document):
+        """
+        Cache a processed document
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?)', (key, json.dumps(document), time.time()))
+
+    def stats(self):
+        """
+        Return the number of hits and misses and the hit rate
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+
+class ResultsCache:
+    """
+    Cache of the score tables of the checks, keyed by the analyzed file, the compared files, the database version and the options
+    which change the scores, stored on disk (sqlite). A table scored with a threshold and a closeness serves the checks with
+    a higher or equal threshold and closeness
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'results.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, threshold REAL, closeness INTEGER, scores TEXT, created_at REAL)')
+        return self.connection
+
+    def get(self, key, threshold, closeness):
+        """
+        Return the cached score table of a key if it serves the threshold and closeness, or None
+        """
+        with self.lock:
+            row = self.connect().execute('SELECT scores FROM results WHERE key = ? AND threshold <= ? AND closeness <= ?', (key, threshold, closeness)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, threshold, closeness, scores):
+        """
+        Cache the score table of a key, replacing the older one
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', (key, threshold, closeness, json.dumps(scores), time.time()))
+
+    def stats(self):
+        """
+        Return the number of hits and misses and the hit rate
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+
+def document_key(path, version):
+    """
+    Return the key of a file, a hash of its content and the version of the processing pipeline
+    """
+    with open(path, 'rb') as file:
+        return hashlib.sha1(hashlib.sha1(file.read()).digest() + version.encode('utf-8')).hexdigest()
+
+def content_hash(content):
+    """
+    Return a hash of the content of a page
+    """
+    return hashlib.sha1(content).hexdigest()
@@ -0,0 +1,327 @@
+import os
+import ast
+import time
+import hashlib
+import argparse
+
+from helper import pd, np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from vectors import store_vectors
+from index import store_topics, store_sentences
+from lsh import store_lsh
+from fingerprint import store_fingerprints, document_fingerprints
+from registry import get_vocabulary
+from vocabulary import TokenCorpus, token_corpus
+
+DATABASE_PATH = './database/'
+
+#The documents are stored into folders shard=<name>, e.g. a course or a year. Without a name,
+#each document goes to one of N_SHARDS shards by its id. The files written before the shards belong to the shard ''
+N_SHARDS = 8
+
+#Each store writes a new file in each shard, so a shard is compacted into a single file when it has more files than this
+MAX_PARTS = 64
+
+#The files are sorted by document id and written in small row groups, so reading some documents by id skips most of the row groups
+ROW_GROUP_SIZE = 64
+
+#Columns needed to look for similarities
+QUERY_COLUMNS = ['doc_id', 'filename', 'author', 'topic', 'corpus', 'processed_corpus']
+
+#Columns with lists which can be empty (NaN)
+NULLABLE_COLUMNS = ['author', 'citations', 'headers']
+
+#The processed corpus is stored as the index of each sentence, the lemma ids of all the sentences and the offset where each one starts.
+#The processed sentences are only read from the files written before the lemma ids, which have no fingerprints either
+SCHEMA = pa.schema([
+    ('doc_id', pa.string()),
+    ('version', pa.int64()),
+    ('filename', pa.string()),
+    ('text', pa.string()),
+    ('author', pa.list_(pa.string())),
+    ('citations', pa.list_(pa.string())),
+    ('headers', pa.list_(pa.string())),
+    ('topic', pa.list_(pa.string())),
+    ('corpus', pa.list_(pa.string())),
+    ('processed_index', pa.list_(pa.int32())),
+    ('processed_tokens', pa.list_(pa.int32())),
+    ('processed_offsets', pa.list_(pa.int32())),
+    ('processed_sentences', pa.list_(pa.string())),
+    ('fingerprints', pa.list_(pa.int64())),
+])
+
+
+#---Read-----------------------------------------------------------------------------------------------------------------------
+def read_documents(columns=None, filters=None, path=DATABASE_PATH, shards=None):
+    """
+    Read the stored documents and return a dataframe with the last version of each one.
+    Only the given columns are loaded, only the given shards are read if shards is not None,
+    and the rows can be selected with pyarrow filters, e.g. [('filename', 'in', names)]
+    """
+    columns = columns or [name for name in SCHEMA.names if not name.startswith('processed_')] + ['processed_corpus']
+    stored_columns = [column for column in columns if column not in ['doc_id', 'version', 'processed_corpus']] + ['doc_id', 'version']
+    if 'processed_corpus' in columns:
+        stored_columns += ['processed_index', 'processed_tokens', 'processed_offsets', 'processed_sentences']
+
+    files = part_files(path, shards)
+    if not files:
+        return pd.DataFrame(columns=columns)
+
+    #A compaction may remove the files while they are read, then they are listed again
+    try:
+        table = pq.read_table(files, columns=stored_columns, filters=filters, schema=SCHEMA)
+    except FileNotFoundError:
+        return read_documents(columns, filters, path, shards)
+    df = table_to_dataframe(table)
+
+    #Keep only the last version of each document
+    df = df.sort_values('version', kind='stable')
+    df = df[~df.duplicated('doc_id', keep='last')].reset_index(drop=True)
+
+    return df[columns]
+
+def database_version(path=DATABASE_PATH):
+    """
+    Return a version of the database which changes each time documents are appended
+    """
+    if not os.path.isdir(path):
+        return ''
+
+    names = [os.path.relpath(file, path) for file in part_files(path)]
+    return hashlib.sha1('\n'.join(names).encode('utf-8')).hexdigest()
+
+def shard_names(path=DATABASE_PATH):
+    """
+    Return the sorted names of the shards of the database
+    """
+    if not os.path.isdir(path):
+        return []
+
+    names = [name[len('shard='):] for name in os.listdir(path) if name.startswith('shard=') and os.path.isdir(os.path.join(path, name))]
+    if any(name.endswith('.parquet') and not name.startswith('.') for name in os.listdir(path)):
+        names.append('')
+
+    return sorted(names)
+
+def part_files(path=DATABASE_PATH, shards=None):
+    """
+    Return the sorted paths of the parquet files of the database, or only of the given shards.
+    Files being written are hidden, so they are never read
+    """
+    files = []
+    for shard in (shard_names(path) if shards is None else shards):
+        folder = os.path.join(path, 'shard=' + shard) if shard else path
+        if os.path.isdir(folder):
+            files += [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith('.parquet') and not name.startswith('.')]
+
+    return files
+
+def table_to_dataframe(table):
+    """
+    Convert a pyarrow table into a dataframe with python lists, the same way they are built when processing a file
+    """
+    df = pd.DataFrame({column: table.column(column).to_pylist() for column in table.column_names if not column.startswith('processed_') and column != 'fingerprints'})
+
+    if 'fingerprints' in table.column_names:
+        missing = table.column('fingerprints').is_null().to_numpy(zero_copy_only=False)
+        df['fingerprints'] = [None if is_missing else fingerprints for is_missing, fingerprints in zip(missing, list_arrays(table.column('fingerprints')))]
+
+    if 'processed_index' in table.column_names:
+        df['processed_corpus'] = table_to_corpora(table)
+
+    #Empty lists are stored as nulls, but the rest of the code expects NaN
+    for column in NULLABLE_COLUMNS:
+        if column in df:
+            df[column] = df[column].apply(lambda x: np.nan if x is None else x)
+
+    return df
+
+def table_to_corpora(table):
+    """
+    Return the processed corpus of each row of a pyarrow table as a TokenCorpus.
+    The arrays of the rows are views of one array for each column
+    """
+    index, tokens, offsets = [list_arrays(table.column(column)) for column in ['processed_index', 'processed_tokens', 'processed_offsets']]
+    legacy = table.column('processed_tokens').is_null().to_numpy(zero_copy_only=False)
+
+    corpora = [TokenCorpus(*arrays) for arrays in zip(index, tokens, offsets)]
+
+    #Encode the processed sentences of the rows written before the lemma ids. They are stored documents, so their lemmas are interned
+    if legacy.any():
+        sentences = table.column('processed_sentences').to_pylist()
+        for i in np.flatnonzero(legacy):
+            corpora[i] = token_corpus(list(zip(index[i].tolist(), sentences[i] or [])), get_vocabulary(), persist=True)
+
+    return corpora
+
+def list_arrays(column):
+    """
+    Return a numpy array for each list of a pyarrow list column
+    """
+    column = column.combine_chunks()
+    values = column.values.to_numpy(zero_copy_only=False)
+    offsets = column.offsets.to_numpy()
+    return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+#---Write----------------------------------------------------------------------------------------------------------------------
+def append_documents(df, path=DATABASE_PATH, shard=None):
+    """
+    Append the processed documents of a dataframe to the database as a new parquet file in each shard, without rewriting the stored ones.
+    Each document gets an id from its shard and file name, and the time as version, so storing a new version of a file replaces the older one.
+    The documents go to the given shard, or to a shard chosen by their id.
+    The file is written with a hidden name and then renamed, so readers never see a half-written file
+    """
+    if df.empty:
+        return df
+
+    df = df.copy()
+    df['doc_id'] = [document_id(filename, shard) for filename in df['filename']]
+    df['version'] = time.time_ns()
+
+    #The lemmas are interned only when the documents are stored, and the fingerprints of the lemmas which had transient ids are computed again
+    corpora = [token_corpus(processed_corpus, get_vocabulary(), persist=True) for processed_corpus in df['processed_corpus']]
+    if 'fingerprints' in df:
+        df['fingerprints'] = [fingerprints if corpus is processed_corpus else document_fingerprints(corpus) for fingerprints, corpus, processed_corpus in zip(df['fingerprints'], corpora, df['processed_corpus'])]
+    df['processed_corpus'] = corpora
+
+    if shard is not None and (not shard or os.sep in shard or shard.startswith('.')):
+        raise Exception('ERROR: Invalid shard name {!r}'.format(shard))
+    shards = [shard or document_shard(doc_id) for doc_id in df['doc_id']]
+
+    for name, shard_df in df.groupby(np.array(shards), sort=True):
+        folder = os.path.join(path, 'shard=' + name)
+        os.makedirs(folder, exist_ok=True)
+        file_name = 'part-{}-{}.parquet'.format(shard_df['version'].iloc[0], shard_df['doc_id'].iloc[0][:8])
+        temp_path = os.path.join(folder, '.' + file_name)
+
+        pq.write_table(dataframe_to_table(shard_df.sort_values('doc_id')), temp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(temp_path, os.path.join(folder, file_name))
+
+        if len(part_files(path, [name])) > MAX_PARTS:
+            compact_shard(name, path)
+
+    return df
+
+def compact_shard(shard, path=DATABASE_PATH):
+    """
+    Rewrite the files of a shard as a single file with the last version of each document.
+    The new file is renamed into the shard before the old ones are removed, so readers always find every document
+    """
+    files = part_files(path, [shard])
+    if len(files) < 2:
+        return
+
+    #Another process may be compacting the same shard
+    try:
+        table = pq.read_table(files, schema=SCHEMA)
+    except FileNotFoundError:
+        return
+
+    #Keep only the last version of each document
+    versions = pd.DataFrame({'doc_id': table.column('doc_id').to_pandas(), 'version': table.column('version').to_pandas()})
+    versions = versions.sort_values('version', kind='stable')
+    table = table.take(versions.index[~versions.duplicated('doc_id', keep='last')].to_numpy()).sort_by('doc_id')
+
+    folder = os.path.join(path, 'shard=' + shard) if shard else path
+    file_name = 'part-{}-compacted.parquet'.format(time.time_ns())
+    temp_path = os.path.join(folder, '.' + file_name)
+    pq.write_table(table, temp_path, row_group_size=ROW_GROUP_SIZE)
+    os.replace(temp_path, os.path.join(folder, file_name))
+
+    for file in files:
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+
+def compact(path=DATABASE_PATH, shards=None):
+    """
+    Compact each shard of the database, or only the given shards
+    """
+    for shard in (shard_names(path) if shards is None else shards):
+        compact_shard(shard, path)
+
+def document_id(filename, shard=None):
+    """
+    Return the id of a document, a hash of its shard and file name. A revised file keeps its id and gets a new version
+    """
+    return hashlib.sha1('{}\0{}'.format(shard or '', filename).encode('utf-8')).hexdigest()
+
+def document_shard(doc_id):
+    """
+    Return the shard of a document stored without a shard name
+    """
+    return '{:02d}'.format(int(doc_id[:8], 16) % N_SHARDS)
+
+def dataframe_to_table(df):
+    """
+    Convert a dataframe with processed documents into a pyarrow table with the database schema
+    """
+    columns = {}
+    for column in SCHEMA.names:
+        if column.startswith('processed_') or column == 'fingerprints':
+            continue
+        values = df[column] if column in df else [None] * len(df)
+        columns[column] = [None if isinstance(value, float) and np.isnan(value) else value for value in values]
+
+    corpora = [token_corpus(processed_corpus, get_vocabulary(), persist=True) for processed_corpus in df['processed_corpus']]
+    columns['processed_index'] = [corpus.index.tolist() for corpus in corpora]
+    columns['processed_tokens'] = [corpus.tokens.tolist() for corpus in corpora]
+    columns['processed_offsets'] = [corpus.offsets.tolist() for corpus in corpora]
+    columns['processed_sentences'] = [None] * len(corpora)
+
+    #The fingerprints of the documents processed before them are computed from the processed corpus
+    fingerprints = df['fingerprints'] if 'fingerprints' in df else [None] * len(df)
+    columns['fingerprints'] = [(value if isinstance(value, np.ndarray) else document_fingerprints(corpus)).tolist() for value, corpus in zip(fingerprints, corpora)]
+
+    return pa.Table.from_pydict(columns, schema=SCHEMA)
+
+#---Migrate--------------------------------------------------------------------------------------------------------------------
+def migrate_csv(csv_path, path=DATABASE_PATH, shard=None):
+    """
+    Read a database stored as csv, convert the lists represented as strings to lists,
+    write it into the parquet database and store its sentence vectors and index its topics, sentences, near-duplicate sentences and fingerprints
+    """
+    df = pd.read_csv(csv_path)
+    df = get_lists(df)
+    df = append_documents(df, path, shard)
+    store_vectors(df)
+    store_topics(df)
+    store_sentences(df)
+    store_lsh(df)
+    store_fingerprints(df)
+
+    return df
+
+def get_lists(df):
+    """
+    Converts lists represented as strings to lists
+    """
+    for column in NULLABLE_COLUMNS + ['topic', 'corpus', 'processed_corpus']:
+        if column in df:
+            df[column] = df[column].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
+
+    #Remove empty headers
+    df['headers'] = df['headers'].apply(lambda x: [header for header in x if header] if isinstance(x, list) else x)
+
+    return df
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Migrate a csv database to the parquet database, or compact the files of its shards")
+
+    parser.add_argument("csv_path", nargs='?', default=None, help="Path to the csv database")
+    parser.add_argument("-d", "--database_path", type=str, default=DATABASE_PATH, help="Path to the parquet database (default: ./database/)")
+    parser.add_argument("--shard", type=str, default=None, help="Shard of the migrated documents, e.g. a course or a year (default: by document id)")
+    parser.add_argument("--compact", action="store_true", help="Rewrite the files of each shard as a single file with the last version of each document")
+
+    args = parser.parse_args()
+
+    if args.csv_path:
+        migrate_csv(args.csv_path, args.database_path, args.shard)
+    if args.compact:
+        compact(args.database_path)
+    if not args.csv_path and not args.compact:
+        parser.error('Nothing to do: give a csv_path or --compact')
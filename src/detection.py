@@ -0,0 +1,442 @@
+import os
+import copy
+import json
+import hashlib
+import threading
+
+from functools import partial
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from reader import read_file, read_files, list_files, path_to_filename, read_database
+from processor import processing_pipeline, pipeline_version, cached_document, document_from_cache
+from cache import document_key
+from similarity import db_similarities, web_similarities, merge_similarities, file_counts, SimilarityStream, ScoreTable
+from topic import similar_topics
+from helper import pd, merge_dataframes
+from vectors import store_vectors, read_vectors, vectorize
+from index import store_topics, store_sentences
+from lsh import store_lsh
+from fingerprint import store_fingerprints, similar_fingerprints
+from database import append_documents, document_id, database_version, shard_names, QUERY_COLUMNS
+from server import serve
+from metrics import metrics
+from registry import cache_stats, reset, reset_indexes, get_document_cache, get_results_cache, get_vocabulary, get_topic_index
+from vocabulary import TokenCorpus
+
+
+def plagiarism_detection(file_path, options):
+    """
+    Receive a file path and the options of the command line and write a json with the similarities,
+    or a JSON line for each sentence with similarities if options.stream is True.
+    The scores of each check with the database are cached, so checking the same files again with another threshold
+    or closeness only filters them. The websites are always scored again, with the pages of the page cache while they are fresh
+    """
+
+    #Read and process the file, or take it from the document cache
+    file = process_files([file_path], options, 'read_file')
+    file['doc_id'] = [document_id(filename, options.shard) for filename in file['filename']]
+
+    #Without storing, the database does not change, so the results can be rebuilt from the scores of an earlier check
+    key = None if options.store else results_key(file.iloc[0], file_path, options)
+    scores = get_results_cache().get(key, options.threshold, options.closeness) if key else None
+    if scores is not None:
+        table = ScoreTable.from_dict(scores)
+        write_similarities('results', lambda similarities: replay_check(file.iloc[0], table, options, similarities), options)
+        if options.profile:
+            metrics.dump('results.metrics.json', cache_stats())
+        return
+
+    comparing_files, new_files = read_comparing_files(options)
+
+    #If store is True, append only the analyzed file and the new comparing files to the database
+    if options.store:
+        stored_files = append_documents(merge_dataframes(file, new_files), shard=options.shard)
+        store_vectors(stored_files)
+        store_topics(stored_files)
+        store_sentences(stored_files)
+        store_lsh(stored_files)
+        store_fingerprints(stored_files)
+
+    vectors = read_vectors()
+
+    #Streaming writes each sentence as soon as it is scored, so its scores are not recorded.
+    #The scores are recorded down to options.score_floor, so later checks with a threshold down to it are only filtered
+    if key and not options.stream:
+        floor = options.threshold if options.score_floor is None else min(options.threshold, options.score_floor)
+        table = ScoreTable(floor, options.closeness)
+        scoring_options = copy.copy(options)
+        scoring_options.threshold = table.threshold
+        check_database(file.iloc[0], comparing_files, vectors, scoring_options, table)
+        get_results_cache().set(key, table.threshold, table.closeness, table.to_dict())
+        write_similarities('results', lambda similarities: replay_check(file.iloc[0], table, options, similarities), options)
+    else:
+        write_similarities('results', lambda similarities: check_file(file.iloc[0], comparing_files, vectors, options, similarities), options)
+
+    if options.profile:
+        metrics.dump('results.metrics.json', cache_stats())
+
+def replay_check(file, table, options, similarities=None):
+    """
+    Rebuild the similarities of a file with the database from its ScoreTable and score the websites again.
+    The websites found for its topic and their pages are taken from the caches while they are fresh
+    """
+    with metrics.stage('get_similarities'):
+        with metrics.stage('read_matched'):
+            table.rows.update(read_matched(table.needed(options.closeness), options))
+        similarities = table.replay(similarities, options.threshold, options.closeness, file['corpus'])
+        return web_similarities(file, similarities, options.threshold)
+
+def read_matched(names, options):
+    """
+    Return the compared documents with the given names, by name: the files of comparing_path, taken from the document cache,
+    and then the stored documents. A comparing file hides the stored document with its name, like when they are checked
+    """
+    rows = {}
+    if names and options.comparing_path:
+        comparing_files, _ = read_comparing_files(options)
+        rows.update((name, row) for name, row in zip(comparing_files['doc_id'], comparing_files.to_dict('records')) if name in names)
+
+    stored = [name for name in names if name not in rows]
+    if stored and options.database:
+        stored_files = read_database(['doc_id', 'filename', 'author', 'corpus'], filters=[('doc_id', 'in', stored)], shards=options.shards)
+        rows.update(zip(stored_files['doc_id'], stored_files.to_dict('records')))
+
+    return rows
+
+def results_key(file, file_path, options):
+    """
+    Return the key of the results of a check: a hash of the analyzed file and its id, which is left out of the compared documents,
+    the compared files and their names, the database version and the options which change the scores, except the threshold and the closeness
+    """
+    version = '{}-{}'.format(pipeline_version(), options.pdf_reader)
+    comparing_files = list_files(options.comparing_path) if options.comparing_path else None
+    check = {'file': document_key(file_path, version),
+             'doc_id': file['doc_id'],
+             'filename': file['filename'],
+             'comparing_files': [[filename, document_key(path, version)] for filename, path in zip(unique_filenames(comparing_files), comparing_files)] if comparing_files else None,
+             'database': database_version() if options.database else None,
+             'options': {name: getattr(options, name, None) for name in ['shard', 'shards', 'shard_workers', 'fingerprint_overlap', 'lsh_bands']},
+             'table': ScoreTable.VERSION}
+
+    return hashlib.sha1(json.dumps(check, sort_keys=True).encode('utf-8')).hexdigest()
+
+def read_comparing_files(options):
+    """
+    Read and process the files of comparing_path. The database is not read here: the candidates of each checked file
+    are read when it is checked (see read_candidates).
+    Return the files to compare with and the new files which are not in the database
+    """
+    if not options.comparing_path and not options.database:
+        raise Exception('No files to compare')
+
+    #If comparing_path is empty, the file is only compared with the database
+    if not options.comparing_path:
+        return pd.DataFrame(columns=QUERY_COLUMNS), None
+
+    #Read the files from the path and store them in a dataframe
+    new_files = process_path(options.comparing_path, options)
+    new_files['doc_id'] = [document_id(filename, options.shard) for filename in new_files['filename']]
+
+    return new_files, new_files
+
+def read_candidates(file, options, shards=None, compared=(), database=None):
+    """
+    Read the stored documents with more than closeness topics in common with the file. The candidates are found in the topic index,
+    where every document is indexed when it is stored, and only their rows are read from the given shards,
+    or taken from the documents kept in memory (see load_database). The documents whose id is in compared are skipped
+    """
+    doc_ids = sorted(get_topic_index().candidates(file['topic'], options.closeness) - set(compared))
+    metrics.count('stored_candidates', len(doc_ids))
+
+    if database is not None:
+        positions = database.index.get_indexer(doc_ids)
+        return database.iloc[positions[positions >= 0]].reset_index(drop=True)
+
+    if not doc_ids:
+        return pd.DataFrame(columns=QUERY_COLUMNS)
+
+    return read_database(QUERY_COLUMNS, filters=[('doc_id', 'in', doc_ids)], shards=shards)
+
+def load_database(options):
+    """
+    Read the stored documents of the selected shards to keep them in memory, indexed by their id
+    """
+    database = read_database(QUERY_COLUMNS, shards=options.shards)
+    database.index = pd.Index(database['doc_id'])
+    return database
+
+def process_path(path, options):
+    """
+    Read and process all the files in a path, like process_files
+    """
+    return process_files(list_files(path), options)
+
+def process_files(files, options, stage='read_path'):
+    """
+    Read and process a list of files. The files whose content and processing did not change since
+    they were processed are taken from the document cache, and only the new or modified files are read and processed,
+    timing the reading as the given stage.
+    The files with the same name and different extensions are named with their extension, so they are told apart
+    """
+    version = '{}-{}'.format(pipeline_version(), options.pdf_reader)
+    keys = [document_key(file, version) for file in files]
+    filenames = unique_filenames(files)
+
+    document_cache = get_document_cache()
+    cached = document_cache.get(keys)
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    metrics.count('cached_files', len(files) - len(missing))
+
+    processed = {}
+    if missing:
+        with metrics.stage(stage):
+            new_files = read_files([files[i] for i in missing], options.workers, options.pdf_reader, [filenames[i] for i in missing])
+        with metrics.stage('processing_pipeline'):
+            new_files = processing_pipeline(new_files, options.batch_size, options.n_process)
+        processed = {row['filename']: row for row in new_files.to_dict('records')}
+
+    #Keep the order of the files, skipping the ones which could not be read
+    rows = []
+    for filename, key in zip(filenames, keys):
+        if key in cached:
+            rows.append(document_from_cache(cached[key], filename))
+        elif filename in processed:
+            rows.append(processed[filename])
+            document_cache.set(key, cached_document(rows[-1]))
+
+    return pd.DataFrame(rows, columns=['filename', 'text', 'citations', 'headers', 'author', 'topic', 'corpus', 'processed_corpus', 'fingerprints'])
+
+def unique_filenames(files):
+    """
+    Return the file name of each file, with its extension if another file has the same name
+    """
+    filenames = [path_to_filename(file) for file in files]
+    counts = Counter(filenames)
+    return [os.path.basename(file) if counts[filename] > 1 else filename for file, filename in zip(files, filenames)]
+
+def check_file(file, comparing_files, vectors, options, similarities=None, database=None):
+    """
+    Receive a processed file and return its similarities with the comparing files and the stored documents with similar topics,
+    and with the websites. If similarities is a SimilarityStream, they are written as they are scored.
+    The stored documents are taken from database if they are kept in memory
+    """
+    with metrics.stage('get_similarities'):
+        similarities = check_database(file, comparing_files, vectors, options, similarities, database)
+        return web_similarities(file, similarities, options.threshold)
+
+def check_database(file, comparing_files, vectors, options, similarities=None, database=None):
+    """
+    Receive a processed file and return its similarities with the comparing files and the stored documents with similar topics.
+    The stored documents are taken from database if they are kept in memory, or read from the shards of the database
+    in a pool of processes if options.shard_workers is set.
+    A document is compared only once and never with itself.
+    If similarities is a SimilarityStream, they are written as they are scored, and if it is a ScoreTable, they are recorded
+    """
+    similarities = {} if similarities is None else similarities
+
+    metrics.count('sentences', len(file['corpus']))
+    metrics.count('processed_sentences', len(file['processed_corpus']))
+    compared = set(comparing_files['doc_id'].dropna()) if 'doc_id' in comparing_files else set()
+    compared.add(file.get('doc_id'))
+
+    #Read only the stored documents which can pass the topic filter
+    sharded = options.database and options.shard_workers and database is None
+    if options.database and not sharded:
+        with metrics.stage('read_candidates'):
+            comparing_files = merge_dataframes(comparing_files, read_candidates(file, options, options.shards, compared, database))
+
+    metrics.count('documents', len(comparing_files))
+    comparing_files = filter_files(file, comparing_files, options)
+    if isinstance(similarities, ScoreTable):
+        similarities.add_overlaps(file['topic'], comparing_files)
+
+    #Get the similarities between the file and the comparing files
+    with metrics.stage('get_similarities.database'):
+        if not sharded:
+            return db_similarities(file[['corpus', 'processed_corpus']], comparing_files, similarities, options.threshold, vectors, options.lsh_bands)
+
+        #The comparing files are merged with the shards like one more shard, so an exact copy in any of them hides
+        #the other matches of the sentence and each sentence is added once
+        record = isinstance(similarities, ScoreTable)
+        local = ScoreTable(options.threshold, options.closeness) if record else {}
+        db_similarities(file[['corpus', 'processed_corpus']], comparing_files, local, options.threshold, vectors, options.lsh_bands)
+        with metrics.stage('shard_similarities'):
+            results = shard_similarities(file, options, record, compared)
+        return merge_similarities(similarities, [local] + results)
+
+def filter_files(file, comparing_files, options):
+    """
+    Keep only the comparing files sharing enough fingerprints with the file and with similar topics
+    """
+    #Keep only the files sharing enough fingerprints
+    if options.fingerprint_overlap is not None:
+        with metrics.stage('similar_fingerprints'):
+            comparing_files = similar_fingerprints(file, comparing_files, options.fingerprint_overlap)
+        metrics.count('fingerprint_documents', len(comparing_files))
+
+    #Keep only the files with similar topics
+    with metrics.stage('similar_topics'):
+        comparing_files = similar_topics(file, comparing_files, options.closeness)
+    metrics.count('candidate_documents', len(comparing_files))
+
+    return comparing_files
+
+def shard_similarities(file, options, record=False, compared=()):
+    """
+    Check the file against each selected shard of the database in a pool of processes, one shard at a time in each worker.
+    The documents whose id is in compared are already compared with the file, so they are skipped.
+    Return the similarities found in each shard, or their ScoreTable if record is True, sorted by shard name,
+    so merging them gives always the same result
+    """
+    shards = [shard for shard in shard_names() if options.shards is None or shard in options.shards]
+    metrics.count('shards', len(shards))
+    if not shards:
+        return []
+
+    #The transient lemma ids are only known by this process, so the workers get the lemmas of the file
+    if isinstance(file['processed_corpus'], TokenCorpus) and file['processed_corpus'].transient():
+        file = file.copy()
+        file['processed_corpus'] = file['processed_corpus'].sentences(get_vocabulary())
+        file['fingerprints'] = None
+
+    #The workers forget the loaded indexes and open their own connections
+    with ProcessPoolExecutor(max_workers=options.shard_workers, initializer=reset) as executor:
+        results = list(executor.map(partial(check_shard, file=file, options=options, record=record, compared=compared), shards))
+
+    for _, report in results:
+        metrics.merge(report)
+
+    return [similarities for similarities, _ in results]
+
+def check_shard(shard, file, options, record=False, compared=()):
+    """
+    Return the similarities of a processed file with the documents of a shard of the database which are not in compared,
+    or their ScoreTable if record is True, and the metrics of the check
+    """
+    metrics.reset()
+
+    with metrics.stage('read_shard'):
+        comparing_files = read_candidates(file, options, [shard], compared)
+    metrics.count('documents', len(comparing_files))
+    comparing_files = filter_files(file, comparing_files, options)
+
+    similarities = {}
+    if record:
+        similarities = ScoreTable(options.threshold, options.closeness)
+        similarities.add_overlaps(file['topic'], comparing_files)
+    with metrics.stage('get_similarities.database'):
+        db_similarities(file[['corpus', 'processed_corpus']], comparing_files, similarities, options.threshold, read_vectors(), options.lsh_bands)
+
+    return similarities, metrics.report()
+
+def write_similarities(path, check, options):
+    """
+    Write the similarities returned by check into path + '.json', or stream them into path + '.jsonl' if options.stream is True.
+    Return the number of sentences with similarities in each plagiarized file
+    """
+    if options.stream:
+        with open(path + '.jsonl', 'w') as results_file:
+            stream = SimilarityStream(results_file, options.top_k)
+            check(stream)
+        return stream.file_counts()
+
+    similarities = check(None)
+    with open(path + '.json', 'w') as results_file:
+        json.dump(similarities, results_file, indent=4, sort_keys=True)
+    return file_counts(similarities)
+
+
+def cohort_detection(folder_path, options):
+    """
+    Receive a folder path and compare each file with the other files of the folder and with the database.
+    Each file is read, processed and vectorized only once. Write a json (or JSON lines with options.stream)
+    with the similarities of each file and a json with the cohort summary into output_path
+    """
+
+    #Read and process all the files of the folder at once, taking the unchanged ones from the document cache
+    files = process_path(folder_path, options)
+    files['doc_id'] = [document_id(filename, options.shard) for filename in files['filename']]
+
+    if options.store:
+        stored_files = append_documents(files, shard=options.shard)
+        store_vectors(stored_files)
+        store_topics(stored_files)
+        store_sentences(stored_files)
+        store_lsh(stored_files)
+        store_fingerprints(stored_files)
+
+    #Vectorize the files of the folder which are not stored
+    vectors = read_vectors()
+    vectors.update({row['doc_id']: vectorize(row['processed_corpus']) for _, row in files.iterrows() if row['doc_id'] not in vectors})
+
+    os.makedirs(options.output_path, exist_ok=True)
+    counts = {}
+
+    for _, file in files.iterrows():
+
+        #Compare the file with the other files and the stored documents with similar topics
+        others = files[files['doc_id'] != file['doc_id']]
+        counts[file['filename']] = write_similarities(os.path.join(options.output_path, file['filename']),
+                                                      lambda similarities: check_file(file, others, vectors, options, similarities), options)
+
+    with open(os.path.join(options.output_path, 'cohort.json'), 'w') as summary_file:
+        json.dump(cohort_summary(files, counts), summary_file, indent=4, sort_keys=True)
+
+    if options.profile:
+        metrics.dump(os.path.join(options.output_path, 'cohort.metrics.json'), cache_stats())
+
+def serve_detection(options):
+    """
+    Keep the model, the comparing files, the stored documents and their vectors loaded and check the files sent to a local HTTP server.
+    The candidates of each file are taken from the documents in memory, which are read again with their vectors, and the indexes opened again,
+    only when documents are appended to the database. With options.profile, the metrics of each check are appended to serve.metrics.jsonl
+    """
+    state = {}
+    lock = threading.Lock()
+    profile_lock = threading.Lock()
+
+    def load():
+        with lock:
+            if state.get('version') != database_version():
+                state['version'] = database_version()
+                reset_indexes()
+                state['comparing_files'], _ = read_comparing_files(options)
+                state['vectors'] = read_vectors()
+                state['database'] = load_database(options) if options.database else None
+            return state['comparing_files'], state['vectors'], state['database']
+
+    def check(file_path):
+        #Each check records its own metrics, since the checks run at the same time
+        with metrics.scope() as check_metrics:
+            comparing_files, vectors, database = load()
+            with metrics.stage('read_file'):
+                file = read_file(file_path, options.pdf_reader)
+            with metrics.stage('processing_pipeline'):
+                file = processing_pipeline(file, options.batch_size, options.n_process)
+            similarities = check_file(file.iloc[0], comparing_files, vectors, options, database=database)
+
+        if options.profile:
+            with profile_lock, open('serve.metrics.jsonl', 'a') as metrics_file:
+                metrics_file.write(json.dumps({'filename': path_to_filename(file_path), **check_metrics.report(cache_stats())}, sort_keys=True) + '\n')
+        return similarities
+
+    #Load everything before the first request
+    load()
+    serve(check, options.host, options.port, options.server_workers)
+
+def cohort_summary(files, counts):
+    """
+    Receive the number of sentences of each file with similarities in each plagiarized file and return the share
+    of the processed sentences of each file with similarities in each other file of the cohort,
+    as a matrix with a row for each file, and in each file of the database
+    """
+    filenames = list(files['filename'])
+    matrix = []
+    database_shares = {}
+
+    for filename, processed_corpus in zip(filenames, files['processed_corpus']):
+        n_sentences = max(len(processed_corpus), 1)
+        matrix.append([counts[filename].get(other, 0) / n_sentences for other in filenames])
+        database_shares[filename] = {other: count / n_sentences for other, count in counts[filename].items() if other is not None and other not in filenames}
+
+    return {'files': filenames, 'matrix': matrix, 'database': database_shares}
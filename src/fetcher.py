@@ -0,0 +1,82 @@
+import time
+import urllib3
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+#Seconds allowed for each request and for all of them
+TIMEOUT = 10
+DEADLINE = 30
+
+#Maximum number of requests at the same time and of bytes read from each response
+MAX_WORKERS = 8
+MAX_BYTES = 5 * 1024 * 1024
+
+#Connections are kept open and reused for each host
+pool = urllib3.PoolManager(num_pools=50, maxsize=MAX_WORKERS, headers={'User-Agent': 'Mozilla/5.0'}, retries=urllib3.Retry(total=2, connect=2, read=0, redirect=5))
+
+
+def fetch_urls(urls, timeout=TIMEOUT, deadline=DEADLINE, max_workers=MAX_WORKERS, max_bytes=MAX_BYTES, pool=pool):
+    """
+    Fetch the URLs at the same time and return a dictionary with the URL as key and the content as value.
+    The URLs which fail, or do not answer before the deadline, are left out
+    """
+    pages = fetch_pages(urls, {}, timeout, deadline, max_workers, max_bytes, pool)
+    return {url: content for url, (status, _, content) in pages.items() if status == 200}
+
+def fetch_pages(urls, headers={}, timeout=TIMEOUT, deadline=DEADLINE, max_workers=MAX_WORKERS, max_bytes=MAX_BYTES, pool=pool):
+    """
+    Fetch the URLs at the same time, with the request headers of each URL (e.g. conditional request headers),
+    and return a dictionary with the URL as key and the status, the response headers and the content as value.
+    The URLs which fail, or do not answer before the deadline, are left out
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+
+    end = time.monotonic() + deadline
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(fetch_url, url, timeout, end, max_bytes, pool, headers.get(url)): url for url in urls}
+
+    done, not_done = wait(futures, timeout=deadline)
+
+    #Do not wait for the requests which are still running
+    for future in not_done:
+        future.cancel()
+    executor.shutdown(wait=False)
+
+    contents = {}
+    for future in done:
+        if future.exception() is None and future.result() is not None:
+            contents[futures[future]] = future.result()
+
+    #Keep the order of the URLs
+    return {url: contents[url] for url in urls if url in contents}
+
+def fetch_url(url, timeout, end, max_bytes, pool=pool, headers=None):
+    """
+    Fetch an URL and return the status, the response headers and the content, read up to max_bytes.
+    Return None if the response is not successful or the deadline is reached
+    """
+    remaining = end - time.monotonic()
+    if remaining <= 0:
+        return None
+
+    response = pool.request('GET', url, headers=dict(pool.headers, **(headers or {})), timeout=urllib3.Timeout(connect=min(timeout, remaining), read=min(timeout, remaining)), preload_content=False)
+    try:
+        if response.status >= 400:
+            return None
+        if response.status == 304:
+            return response.status, dict(response.headers), b''
+
+        content = b''
+        for chunk in response.stream(64 * 1024):
+            content += chunk
+            if len(content) >= max_bytes or time.monotonic() > end:
+
+                #The rest of the response is not read, so the connection can not be reused
+                response.close()
+                break
+        return response.status, dict(response.headers), content[:max_bytes]
+
+    finally:
+        response.release_conn()
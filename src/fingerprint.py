@@ -0,0 +1,89 @@
+from helper import np
+from index import INDEX_PATH, FingerprintIndex
+from vocabulary import TokenCorpus, token_corpus
+from registry import get_vocabulary, get_fingerprint_index
+from metrics import metrics
+
+#Number of consecutive lemmas of each k-gram and number of k-grams of each window.
+#Every copy of at least K + WINDOW - 1 lemmas shares at least one fingerprint
+K = 5
+WINDOW = 4
+
+BASE = np.uint64(1000003)
+
+
+def winnow(tokens, k=K, window=WINDOW):
+    """
+    Return the winnowed fingerprints of a sequence of lemma ids (MOSS): the hash of each k-gram is computed
+    and the lowest hash of each window of consecutive k-grams is kept. The fingerprints are returned sorted and without repetitions
+    """
+    tokens = np.asarray(tokens, dtype=np.uint64)
+    if len(tokens) < k:
+        return np.zeros(0, dtype=np.int64)
+
+    hashes = np.zeros(len(tokens) - k + 1, dtype=np.uint64)
+    for i in range(k):
+        hashes = hashes * BASE + tokens[i:len(tokens) - k + 1 + i]
+
+    #Mix the bits (splitmix64), so the lowest hash does not depend only on the first lemma
+    hashes ^= hashes >> np.uint64(30)
+    hashes *= np.uint64(0xbf58476d1ce4e5b9)
+    hashes ^= hashes >> np.uint64(27)
+    hashes *= np.uint64(0x94d049bb133111eb)
+    hashes ^= hashes >> np.uint64(31)
+
+    if len(hashes) > window:
+        hashes = np.lib.stride_tricks.sliding_window_view(hashes, window).min(axis=1)
+    else:
+        hashes = hashes.min(keepdims=True)
+
+    return np.unique(hashes).view(np.int64)
+
+def document_fingerprints(processed_corpus):
+    """
+    Return the winnowed fingerprints of the lemmas of all the sentences of a processed corpus, one after another
+    """
+    return winnow(token_corpus(processed_corpus, get_vocabulary()).tokens)
+
+def row_fingerprints(row):
+    """
+    Return the fingerprints of a row, computing them if they are not stored or if some of its lemmas have transient ids,
+    which may have been interned since the fingerprints were computed
+    """
+    fingerprints = row.get('fingerprints')
+    corpus = row['processed_corpus']
+    if isinstance(fingerprints, np.ndarray) and not (isinstance(corpus, TokenCorpus) and corpus.transient()):
+        return fingerprints
+    return document_fingerprints(corpus)
+
+def similar_fingerprints(df, comparing_df, cutoff, index=None):
+    """
+    Keep only the comparing documents sharing at least a share (cutoff) of the fingerprints of the analyzed document.
+    The shared fingerprints of the stored documents are counted with the fingerprint index, and the ones of the rest are intersected.
+    A document too short to have fingerprints (fewer than K lemmas) cannot be screened, so nothing is filtered out
+    """
+    fingerprints = row_fingerprints(df)
+    if not len(fingerprints) or comparing_df.empty:
+        return comparing_df
+
+    index = index or get_fingerprint_index()
+    doc_ids = comparing_df['doc_id'].tolist() if 'doc_id' in comparing_df else [None] * len(comparing_df)
+    indexed_ids = index.documents()
+    indexed = np.array([doc_id in indexed_ids for doc_id in doc_ids], dtype=bool)
+    counts = index.overlaps(fingerprints) if indexed.any() else {}
+    shared = np.array([counts.get(doc_id, 0) for doc_id in doc_ids])
+
+    for i in np.flatnonzero(~indexed):
+        shared[i] = len(np.intersect1d(fingerprints, row_fingerprints(comparing_df.iloc[i]), assume_unique=True))
+
+    metrics.count('fingerprints.indexed_documents', int(indexed.sum()))
+    return comparing_df[shared >= cutoff * len(fingerprints)]
+
+def store_fingerprints(df, path=INDEX_PATH):
+    """
+    Index the fingerprints of the stored documents
+    """
+    if df.empty:
+        return
+
+    FingerprintIndex(path).add(list(df['doc_id']), [row_fingerprints(row) for _, row in df.iterrows()])
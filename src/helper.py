@@ -1,11 +1,12 @@
-import spacy
 import pandas as pd
 import numpy as np
 import re 
 
 
-df = pd.read_csv('./data.csv')
-nlp = spacy.load('es_core_news_lg')
+#Size of the batches and number of processes used by nlp.pipe
+BATCH_SIZE = 256
+N_PROCESS = 1
+
 author_synonyms = ['nombre','nombres','apellido','apellidos','nombre y apellido','apellido y nombre','nombres y apellidos','apellidos y nombres','alumno','alumnos', 'alumna','alumne','alumnes']
 
 def merge_dataframes(df1, df2):
@@ -14,4 +15,23 @@ def merge_dataframes(df1, df2):
 def append_to_dictionary(dic, key, element):
     dic.setdefault(key, {'n_sentence': 0, 'plagiarism': []})
     dic[key]['plagiarism'] += element
-    
\ No newline at end of file
+    
+
+def get_lemmas(doc):
+    """
+    Return the lowercase lemmas of the tokens of a spacy doc which are not stop words, spaces, punctuation or single characters
+    """
+    return [token.lemma_.lower() for token in doc if not token.is_stop and token.pos_ != 'SPACE' and token.pos_ != 'PUNCT' and len(token.text)>1]
+
+def clean_sentences(string):
+    """
+    Clean a string from special characters and numbers
+    """
+    string = re.sub('([a-zA-Z])-([a-zA-Z])', r'\1\2',string)
+    string = string.replace('\n',' ')
+    string = re.sub('●|•|-|”|“|°|,|/|:|\?|¿|!|¡',' ', string)
+    string = string.replace('(',' ').replace(')',' ').replace('[',' ').replace(']',' ').replace('{',' ').replace('}',' ')
+    string = re.sub('\d', ' ', string)
+    string = re.sub('\s+',' ',string)
+    string = string.strip()
+    return string
@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+INDEX_PATH = './index/'
+
+
+class TopicIndex:
+    """
+    Inverted index from each topic lemma to the ids of the stored documents with it, stored on disk (sqlite).
+    The documents with more than closeness topics in common with a file are found by counting its posting lists
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'topics.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS postings (term TEXT, doc_id TEXT, PRIMARY KEY (term, doc_id)) WITHOUT ROWID')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS postings_doc_id ON postings (doc_id)')
+        return self.connection
+
+    def add(self, doc_ids, topics):
+        """
+        Index the topic of each document, replacing the one of its older version
+        """
+        rows = [(term, doc_id) for doc_id, topic in zip(doc_ids, topics) for term in set(topic)]
+
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.executemany('INSERT OR IGNORE INTO documents VALUES (?)', [(doc_id,) for doc_id in doc_ids])
+                connection.executemany('DELETE FROM postings WHERE doc_id = ?', [(doc_id,) for doc_id in doc_ids])
+                connection.executemany('INSERT OR IGNORE INTO postings VALUES (?, ?)', rows)
+
+    def indexed(self, doc_ids):
+        """
+        Return the set of the given document ids which are indexed
+        """
+        doc_ids = list(set(doc_ids))
+        found = set()
+
+        with self.lock:
+            connection = self.connect()
+            for i in range(0, len(doc_ids), 500):
+                chunk = doc_ids[i:i + 500]
+                query = 'SELECT doc_id FROM documents WHERE doc_id IN ({})'.format(','.join('?' * len(chunk)))
+                found.update(doc_id for doc_id, in connection.execute(query, chunk))
+
+        return found
+
+    def candidates(self, topic, closeness):
+        """
+        Return the set of indexed document ids with more than closeness terms of a topic
+        """
+        terms = list(set(topic))
+        if not terms:
+            return set()
+
+        query = 'SELECT doc_id FROM postings WHERE term IN ({}) GROUP BY doc_id HAVING COUNT(*) > ?'.format(','.join('?' * len(terms)))
+        with self.lock:
+            return set(doc_id for doc_id, in self.connect().execute(query, terms + [closeness]))
+
+
+class SentenceIndex:
+    """
+    Index from the hash of each processed sentence to the stored documents and positions where it is, stored on disk (sqlite).
+    The exact copies of a sentence are found with one lookup
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.connection = None
+        self.indexed = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'sentences.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sentences (hash INTEGER, doc_id TEXT, position INTEGER)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS sentences_hash ON sentences (hash)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS sentences_doc_id ON sentences (doc_id)')
+        return self.connection
+
+    def add(self, doc_ids, hashes):
+        """
+        Index the sentence hashes of each document, replacing the ones of its older version
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                for doc_id, document_hashes in zip(doc_ids, hashes):
+                    if not connection.execute('INSERT OR IGNORE INTO documents VALUES (?)', (doc_id,)).rowcount:
+                        connection.execute('DELETE FROM sentences WHERE doc_id = ?', (doc_id,))
+                    connection.executemany('INSERT INTO sentences VALUES (?, ?, ?)', [(int(sentence_hash), doc_id, position) for position, sentence_hash in enumerate(document_hashes)])
+            if self.indexed is not None:
+                self.indexed.update(doc_ids)
+
+    def documents(self):
+        """
+        Return the set of indexed document ids. It is read once, so the documents indexed later by other processes
+        are not in it until the index is opened again
+        """
+        with self.lock:
+            if self.indexed is None:
+                self.indexed = set(doc_id for doc_id, in self.connect().execute('SELECT doc_id FROM documents'))
+            return self.indexed
+
+    def lookup(self, hashes):
+        """
+        Return a dictionary with each hash found as key and a list of (doc_id, position) as value
+        """
+        hashes = list(set(int(sentence_hash) for sentence_hash in hashes))
+        found = {}
+
+        with self.lock:
+            connection = self.connect()
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                query = 'SELECT hash, doc_id, position FROM sentences WHERE hash IN ({})'.format(','.join('?' * len(chunk)))
+                for sentence_hash, doc_id, position in connection.execute(query, chunk):
+                    found.setdefault(sentence_hash, []).append((doc_id, position))
+
+        return found
+
+
+class FingerprintIndex:
+    """
+    Inverted index from the winnowed fingerprints of the stored documents to the documents, stored on disk (sqlite)
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.connection = None
+        self.indexed = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'fingerprints.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS postings (fingerprint INTEGER, doc_id TEXT, PRIMARY KEY (fingerprint, doc_id)) WITHOUT ROWID')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS postings_doc_id ON postings (doc_id)')
+        return self.connection
+
+    def add(self, doc_ids, fingerprints):
+        """
+        Index the fingerprints of each document, replacing the ones of its older version
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                for doc_id, document_fingerprints in zip(doc_ids, fingerprints):
+                    if not connection.execute('INSERT OR IGNORE INTO documents VALUES (?)', (doc_id,)).rowcount:
+                        connection.execute('DELETE FROM postings WHERE doc_id = ?', (doc_id,))
+                    connection.executemany('INSERT OR IGNORE INTO postings VALUES (?, ?)', [(fingerprint, doc_id) for fingerprint in document_fingerprints.tolist()])
+            if self.indexed is not None:
+                self.indexed.update(doc_ids)
+
+    def documents(self):
+        """
+        Return the set of indexed document ids. It is read once, so the documents indexed later by other processes
+        are not in it until the index is opened again
+        """
+        with self.lock:
+            if self.indexed is None:
+                self.indexed = set(doc_id for doc_id, in self.connect().execute('SELECT doc_id FROM documents'))
+            return self.indexed
+
+    def overlaps(self, fingerprints):
+        """
+        Return a dictionary with the number of fingerprints shared with each indexed document sharing any
+        """
+        fingerprints = fingerprints.tolist()
+        counts = {}
+
+        with self.lock:
+            connection = self.connect()
+            for i in range(0, len(fingerprints), 500):
+                chunk = fingerprints[i:i + 500]
+                query = 'SELECT doc_id, COUNT(*) FROM postings WHERE fingerprint IN ({}) GROUP BY doc_id'.format(','.join('?' * len(chunk)))
+                for doc_id, count in connection.execute(query, chunk):
+                    counts[doc_id] = counts.get(doc_id, 0) + count
+
+        return counts
+
+
+def sentence_hashes(corpus):
+    """
+    Return a list with a 64 bits hash of the lemma ids of each sentence of a TokenCorpus
+    """
+    return [int.from_bytes(hashlib.blake2b(tokens.tobytes(), digest_size=8).digest(), 'little', signed=True) for _, tokens in corpus]
+
+def store_topics(df, path=INDEX_PATH):
+    """
+    Index the topics of the stored documents
+    """
+    if df.empty:
+        return
+
+    TopicIndex(path).add(list(df['doc_id']), list(df['topic']))
+
+def store_sentences(df, path=INDEX_PATH):
+    """
+    Index the hashes of the processed sentences of the stored documents
+    """
+    if df.empty:
+        return
+
+    SentenceIndex(path).add(list(df['doc_id']), [sentence_hashes(corpus) for corpus in df['processed_corpus']])
+
+
+if __name__ == "__main__":
+
+    from database import read_documents
+    from lsh import store_lsh
+    from fingerprint import store_fingerprints
+    from vectors import store_vectors, remove_hashed_segments, VECTORS_PATH
+
+    parser = argparse.ArgumentParser(description="Index the topics, the sentences, the near-duplicate sentences and the fingerprints of the documents stored in the database, and vectorize the documents which are not in the vectors store")
+
+    parser.add_argument("-i", "--index", type=str, default=INDEX_PATH, help="Path to the index (default: ./index/)")
+    parser.add_argument("-v", "--vectors", type=str, default=VECTORS_PATH, help="Path to the vectors store (default: ./vectors/)")
+
+    args = parser.parse_args()
+
+    df = read_documents(['doc_id', 'version', 'topic', 'processed_corpus', 'fingerprints'])
+
+    #The documents of the segments vectorized with hashed features are vectorized again with the lemma ids
+    remove_hashed_segments(args.vectors)
+    store_vectors(df, args.vectors)
+    store_topics(df, args.index)
+    store_sentences(df, args.index)
+    store_lsh(df, args.index)
+    store_fingerprints(df, args.index)
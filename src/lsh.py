@@ -0,0 +1,155 @@
+import os
+import sqlite3
+import threading
+
+from helper import np
+from index import INDEX_PATH
+
+#Number of bands and of MinHash values in each band. A pair of sentences with Jaccard similarity s
+#is a candidate with probability 1 - (1 - s**ROWS)**BANDS, about 0.5 for s = 0.55
+BANDS = 20
+ROWS = 5
+
+#Number of consecutive lemmas of each shingle
+SHINGLE_SIZE = 1
+
+PRIME = 2**31 - 1
+SHINGLE_BASE = 1000003
+MAX_TOKENS = 100000
+
+random = np.random.RandomState(42)
+A = random.randint(1, PRIME, size=BANDS * ROWS).astype(np.uint64)
+B = random.randint(0, PRIME, size=BANDS * ROWS).astype(np.uint64)
+MULTIPLIERS = random.randint(1, PRIME, size=ROWS).astype(np.uint64)
+
+
+class LSHIndex:
+    """
+    Locality-sensitive hashing index of the processed sentences of the stored documents, stored on disk (sqlite).
+    Each sentence is split into shingles of lemma ids, summarized with a MinHash signature and stored in a bucket
+    for each band of the signature. The sentences sharing a bucket with a sentence are its candidates
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.connection = None
+        self.indexed = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'lsh.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS buckets (bucket INTEGER, doc_id TEXT, position INTEGER, PRIMARY KEY (bucket, doc_id, position)) WITHOUT ROWID')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS buckets_doc_id ON buckets (doc_id)')
+        return self.connection
+
+    def add(self, doc_ids, corpora):
+        """
+        Index the sentences of each document, replacing the ones of its older version
+        """
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                for doc_id, corpus in zip(doc_ids, corpora):
+                    if not connection.execute('INSERT OR IGNORE INTO documents VALUES (?)', (doc_id,)).rowcount:
+                        connection.execute('DELETE FROM buckets WHERE doc_id = ?', (doc_id,))
+                    positions, buckets = sentence_buckets(corpus)
+                    connection.executemany('INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)', [(int(bucket), doc_id, int(position)) for position, bucket in zip(positions, buckets)])
+            if self.indexed is not None:
+                self.indexed.update(doc_ids)
+
+    def documents(self):
+        """
+        Return the set of indexed document ids. It is read once, so the documents indexed later by other processes
+        are not in it until the index is opened again
+        """
+        with self.lock:
+            if self.indexed is None:
+                self.indexed = set(doc_id for doc_id, in self.connect().execute('SELECT doc_id FROM documents'))
+            return self.indexed
+
+    def candidates(self, corpus, bands=BANDS):
+        """
+        Return a dictionary with the position of each sentence of a TokenCorpus as key and the set of (doc_id, position)
+        of the indexed sentences sharing a bucket with it in the first bands as value. Fewer bands give fewer candidates and less recall
+        """
+        positions, buckets = sentence_buckets(corpus, bands)
+        sentences = {}
+        for position, bucket in zip(positions.tolist(), buckets.tolist()):
+            sentences.setdefault(bucket, []).append(position)
+
+        candidates = {}
+        keys = list(sentences)
+        with self.lock:
+            connection = self.connect()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                query = 'SELECT bucket, doc_id, position FROM buckets WHERE bucket IN ({})'.format(','.join('?' * len(chunk)))
+                for bucket, doc_id, row_position in connection.execute(query, chunk):
+                    for position in sentences[bucket]:
+                        candidates.setdefault(position, set()).add((doc_id, row_position))
+
+        return candidates
+
+
+def shingles(corpus, size=SHINGLE_SIZE):
+    """
+    Return the values of the shingles of size consecutive lemma ids of each sentence of a TokenCorpus,
+    and the offset where the shingles of each sentence start
+    """
+    tokens = corpus.tokens.astype(np.uint64)
+    lengths = np.maximum(np.diff(corpus.offsets) - size + 1, 0)
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+    #Position of the first lemma of each shingle
+    starts = np.arange(offsets[-1]) + np.repeat(corpus.offsets[:-1] - offsets[:-1], lengths)
+
+    values = tokens[starts]
+    for i in range(1, size):
+        values = (values * np.uint64(SHINGLE_BASE) + tokens[starts + i]) % np.uint64(PRIME)
+
+    return values, offsets
+
+def signatures(corpus):
+    """
+    Return a matrix with the MinHash signature of each sentence of a TokenCorpus which has shingles, and their positions
+    """
+    values, offsets = shingles(corpus)
+    positions = np.flatnonzero(np.diff(offsets) > 0)
+    starts = offsets[positions]
+
+    #Hash the shingles of about MAX_TOKENS shingles at once, so the matrix of hashes stays small
+    signature = np.zeros((len(positions), len(A)), dtype=np.uint64)
+    step = max(1, MAX_TOKENS * len(positions) // max(1, len(values)))
+    for first in range(0, len(positions), step):
+        chunk = slice(first, first + step)
+        start, end = starts[chunk][0], offsets[positions[chunk][-1] + 1]
+        hashes = (A[:, None] * values[None, start:end] + B[:, None]) % np.uint64(PRIME)
+        signature[chunk] = np.minimum.reduceat(hashes, starts[chunk] - start, axis=1).T
+
+    return signature, positions
+
+def sentence_buckets(corpus, bands=BANDS):
+    """
+    Return the position of the sentence and the bucket of each band of each sentence of a TokenCorpus
+    """
+    signature, positions = signatures(corpus)
+    keys = (signature.reshape(len(positions), BANDS, ROWS)[:, :bands] * MULTIPLIERS).sum(axis=2)
+
+    #Each band has its own buckets
+    keys = keys + np.arange(bands, dtype=np.uint64) * np.uint64(PRIME)
+    return np.repeat(positions, bands), keys.ravel().view(np.int64)
+
+def store_lsh(df, path=INDEX_PATH):
+    """
+    Index the processed sentences of the stored documents
+    """
+    if df.empty:
+        return
+
+    LSHIndex(path).add(list(df['doc_id']), list(df['processed_corpus']))
@@ -0,0 +1,110 @@
+import time
+import json
+import threading
+import contextvars
+
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Wall time and number of calls of each stage of a check, and counts of the items of each stage
+    (sentences, candidate documents, sentence pairs scored, URLs fetched)
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the code run inside the context as a stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+                stage['seconds'] += seconds
+                stage['calls'] += 1
+
+    def count(self, name, n=1):
+        """
+        Add n items to a count
+        """
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, report):
+        """
+        Add the stages and counts of a report, e.g. the one of a worker process
+        """
+        with self.lock:
+            for name, stage in report['stages'].items():
+                total = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+                total['seconds'] += stage['seconds']
+                total['calls'] += stage['calls']
+            for name, n in report['counts'].items():
+                self.counts[name] = self.counts.get(name, 0) + n
+
+    def reset(self):
+        """
+        Forget the stages and counts recorded
+        """
+        with self.lock:
+            self.stages = {}
+            self.counts = {}
+
+    def report(self, caches={}):
+        """
+        Return the stages, the counts and the stats of the caches
+        """
+        with self.lock:
+            return {'stages': {name: dict(stage) for name, stage in self.stages.items()}, 'counts': dict(self.counts), 'caches': caches}
+
+    def dump(self, path, caches={}):
+        """
+        Write the report as a json
+        """
+        with open(path, 'w') as metrics_file:
+            json.dump(self.report(caches), metrics_file, indent=4, sort_keys=True)
+
+
+class ContextMetrics:
+    """
+    The Metrics of the check running in the current context (thread), or the ones shared by the process outside of a check.
+    The checks run at the same time, e.g. the ones of the server, record their stages and counts apart
+    """
+
+    def __init__(self):
+        self.shared = Metrics()
+        self.current = contextvars.ContextVar('metrics', default=None)
+
+    def get(self):
+        """
+        Return the Metrics of the current context
+        """
+        return self.current.get() or self.shared
+
+    @contextmanager
+    def scope(self):
+        """
+        Record the stages and counts of the code run inside the context in new Metrics, which are returned
+        """
+        check_metrics = Metrics()
+        token = self.current.set(check_metrics)
+        try:
+            yield check_metrics
+        finally:
+            self.current.reset(token)
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+
+#The stages of every module are recorded together, in the Metrics of the current check
+metrics = ContextMetrics()
@@ -2,25 +2,96 @@ from helper import *
 from author import *
 from topic import *
 
-import spacy
 import re
 
-nlp = spacy.load('es_core_news_lg')
+from itertools import chain, accumulate
+from registry import get_nlp, get_lemma_cache, get_vocabulary, MODEL
+from vocabulary import TokenCorpus, token_corpus
+from fingerprint import document_fingerprints
+
+#Version of the processing, change it when the processing changes so the cached documents are processed again
+PIPELINE_VERSION = 1
+
+#Columns of a processed document kept in the document cache
+CACHED_COLUMNS = ['text', 'citations', 'headers', 'author', 'topic', 'corpus']
 
 messy_author_strings = ['nombre','nombres','apellido','apellidos','nombre y apellido','apellido y nombre','nombres y apellidos','apellidos y nombres','alumno','alumnos', 'alumna','alumne','alumnes','legajo','email','mail','correo electronico','e-mail']
 
 
-def processing_pipeline(df):
+def processing_pipeline(df, batch_size=BATCH_SIZE, n_process=N_PROCESS):
+    """
+    Process every document of a dataframe. The texts of all the documents are parsed together in batches
+    """
+    headers = list(df['headers']) if 'headers' in df else [np.nan] * len(df)
 
     df['text'] = df['text'].apply(correct_paragraphs)
-    df['author'] = df.apply(lambda x : get_author(x['text'], x['headers']),axis=1)
+    documents = parse_documents(list(df['text']), headers, batch_size, n_process)
+
+    df['author'] = [document.author for document in documents]
     df.loc[df.author.notnull(),'author'] = df[df.author.notnull()]['author'].apply(delete_not_author)
-    df['topic'] = df['text'].apply(get_topic)
-    df['corpus'] = df['text'].apply(get_corpus)
-    df['processed_corpus'] = df['corpus'].apply(process_indexed_corpus)
+    df['topic'] = [document.topic for document in documents]
+    df['corpus'] = [document.corpus for document in documents]
+    df['processed_corpus'] = [document.processed_corpus for document in documents]
+    df['fingerprints'] = [document_fingerprints(processed_corpus) for processed_corpus in df['processed_corpus']]
 
     return df
 
+def pipeline_version():
+    """
+    Return the version of the processing pipeline and the spacy model
+    """
+    return '{}-{}'.format(PIPELINE_VERSION, MODEL)
+
+def cached_document(row):
+    """
+    Return a processed document as it is stored in the document cache.
+    The processed corpus is stored with the lemmas, so it does not depend on the ids of the vocabulary
+    """
+    document = {column: row.get(column) for column in CACHED_COLUMNS}
+    document['processed_corpus'] = token_corpus(row['processed_corpus'], get_vocabulary()).sentences(get_vocabulary())
+    return document
+
+def document_from_cache(document, filename):
+    """
+    Return a processed document of the document cache with a file name, like the ones of processing_pipeline
+    """
+    row = {'filename': filename}
+    row.update({column: document.get(column) for column in CACHED_COLUMNS})
+    row['processed_corpus'] = token_corpus([tuple(sentence) for sentence in document['processed_corpus']], get_vocabulary())
+    row['fingerprints'] = document_fingerprints(row['processed_corpus'])
+    return row
+
+
+class ParsedDocument:
+    """
+    A document whose sentences are parsed only once.
+    The lemmas of the sentences give both the topic and the processed corpus
+    """
+
+    def __init__(self, corpus, lemmas, author):
+        self.corpus = corpus
+        self.lemmas = lemmas
+        self.author = author
+
+    @property
+    def topic(self):
+        return get_topic_from_lemmas(chain.from_iterable(self.lemmas))
+
+    @property
+    def processed_corpus(self):
+        return TokenCorpus.from_sentences(kept_sentences(self.lemmas), get_vocabulary())
+
+def parse_documents(texts, headers, batch_size=BATCH_SIZE, n_process=N_PROCESS):
+    """
+    Split each text into sentences, parse all the sentences together and look for the authors.
+    Return a ParsedDocument for each text
+    """
+    corpora = [get_corpus(text) for text in texts]
+    lemmas = parse_corpora(corpora, batch_size, n_process)
+    authors = get_authors(texts, headers, batch_size, n_process)
+
+    return [ParsedDocument(corpus, corpus_lemmas, author) for corpus, corpus_lemmas, author in zip(corpora, lemmas, authors)]
+
 
 
 def correct_paragraphs(string):
@@ -53,20 +124,6 @@ def delete_not_author(strings):
 
 
 #---Utils-----------------------------------------------------------------------------------------------------
-def clean_sentences(string):
-    """
-    Clean a string from special characters and numbers
-    """
-    string = re.sub('([a-zA-Z])-([a-zA-Z])', r'\1\2',string)
-    string = string.replace('\n',' ')
-    string = re.sub('●|•|-|”|“|°|,|/|:|\?|¿|!|¡',' ', string)
-    string = string.replace('(',' ').replace(')',' ').replace('[',' ').replace(']',' ').replace('{',' ').replace('}',' ')
-    string = re.sub('\d', ' ', string)
-    string = re.sub('\s+',' ',string)
-    string = string.strip()
-    return string
-
-
 def correct_dots(string):
     """
     Keeps only dots for end of a sentence
@@ -86,18 +143,43 @@ def get_corpus(text):
 
     return corpus
 
-def process_indexed_corpus(corpus):
+def process_indexed_corpora(corpora, batch_size=BATCH_SIZE, n_process=N_PROCESS):
     """
-    Receive a list of sentences and return a list of cleaned sentences with each index
+    Receive a list of corpora and return a processed corpus for each one
+    """
+    return [index_corpus(lemmas) for lemmas in parse_corpora(corpora, batch_size, n_process)]
+
+def index_corpus(lemmas):
     """
-    processed_corpus = []
-    for i, sentence in enumerate(corpus):
-        sentence = clean_sentences(sentence)
-        sentence = nlp(sentence)
-        sentence = [token.lemma_.lower() for token in sentence if not token.is_stop and token.pos_ != 'SPACE' and token.pos_ != 'PUNCT' and len(token.text)>1]
-        if len(sentence) > 3:
-            sentence = ' '.join(sentence)
-            processed_corpus.append((i, sentence))
-    return processed_corpus
+    Receive the lemmas of each sentence and return a list of the processed sentences with each index
+    """
+    return [(i, ' '.join(sentence)) for i, sentence in kept_sentences(lemmas)]
+
+def kept_sentences(lemmas):
+    """
+    Receive the lemmas of each sentence and return a list of (index, lemmas) of the sentences with more than 3 lemmas
+    """
+    return [(i, sentence) for i, sentence in enumerate(lemmas) if len(sentence) > 3]
+
+def parse_corpora(corpora, batch_size=BATCH_SIZE, n_process=N_PROCESS):
+    """
+    Receive a list of corpora and return the lemmas of each sentence of each one.
+    The lemmas of the sentences are taken from the cache, and the rest are parsed together in batches
+    """
+    sentences = [clean_sentences(sentence) for corpus in corpora for sentence in corpus]
+    lemma_cache = get_lemma_cache()
+    lemmas = lemma_cache.get(sentences)
+
+    #Parse only once each sentence which is not cached
+    missing = list(dict.fromkeys(sentence for sentence, sentence_lemmas in zip(sentences, lemmas) if sentence_lemmas is None))
+    docs = get_nlp().pipe(missing, batch_size=batch_size, n_process=n_process, disable=['parser', 'ner'])
+    parsed = {sentence: get_lemmas(doc) for sentence, doc in zip(missing, docs)}
+    lemma_cache.set(list(parsed), list(parsed.values()))
+
+    lemmas = [parsed[sentence] if sentence_lemmas is None else sentence_lemmas for sentence, sentence_lemmas in zip(sentences, lemmas)]
+
+    #Split the lemmas back into corpora
+    offsets = list(accumulate([len(corpus) for corpus in corpora], initial=0))
+    return [lemmas[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
 
 #---------------------------------------------------------------------------------------------------------------
\ No newline at end of file
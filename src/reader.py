@@ -1,8 +1,10 @@
 import os
-import shutil
-import time
-import ast
+import fitz
+import tempfile
+import warnings
 
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from helper import pd, re, np, author_synonyms
 from unicodedata import normalize
 from doc2docx import convert as doc2docx
@@ -11,14 +13,22 @@ from docx import Document
 from docx.opc.constants import RELATIONSHIP_TYPE as RT
 from pdf2docx import Converter
 from bs4 import BeautifulSoup
-from urllib.request import urlopen, Request
-from processor import get_corpus,process_indexed_corpus
+from fetcher import fetch_pages
+from cache import content_hash
+from processor import get_corpus,process_indexed_corpora
+from database import read_documents
+from registry import get_page_cache
+from metrics import metrics
+
+#Number of first pages of a pdf file where the tables with the authors are searched
+TABLE_PAGES = 2
 
 
 #---Read-----------------------------------------------------------------------------------------------------------------------
-def read_file(path):
+def read_file(path, pdf_reader='native'):
     """
-    Read a file and return a dataframe with the file name, the text and the citations
+    Read a file and return a dataframe with the file name, the text and the citations.
+    The .pdf files are read directly ('native') or converted to .docx first ('docx')
     """
     df = pd.DataFrame(columns=['filename','text','citations','headers'])
 
@@ -27,6 +37,8 @@ def read_file(path):
         df = read_docx(path)
     elif path.endswith('.pptx'):
         df = read_pptx(path)
+    elif path.endswith('.pdf') and pdf_reader == 'native':
+        df = read_pdf(path)
     elif path.endswith('.doc') or path.endswith('.pdf'):
         df = read_and_convert_file(path, df)
     else:
@@ -34,87 +46,124 @@ def read_file(path):
 
     return df
 
-def read_path(path):
+def read_path(path, workers=None, pdf_reader='native'):
+    """
+    Read all files in a path and return a dataframe with the file name, the text and the citations.
+    The files are read in parallel by a pool of processes, and the files which can not be read are reported and skipped
+    """
+    return read_files(list_files(path), workers, pdf_reader)
+
+def list_files(path):
     """
-    Read all files in a path and return a dataframe with the file name, the text and the citations
+    Return the sorted paths of the files in a path
     """
-    files = os.listdir(path)
+    return [os.path.join(path, file) for file in sorted(os.listdir(path))]
 
+def read_files(files, workers=None, pdf_reader='native', filenames=None):
+    """
+    Read a list of files in parallel like read_path. The files are named filenames if given, instead of their file names
+    """
+    filenames = filenames or [path_to_filename(file) for file in files]
     if len(files) == 1:
-        return read_file(path + files[0])
+        return read_file(files[0], pdf_reader).assign(filename=filenames[0])
 
-    df = pd.DataFrame(columns=['filename','text','citations','headers'])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(partial(try_read_file, pdf_reader=pdf_reader), files))
 
-    #Create a list of .doc files and concatenate its content to the dataframe
-    docs_and_docxs = [file for file in files if file.endswith('.doc') or file.endswith('.pdf')]
-    df = read_pdf_docs(docs_and_docxs, df, path)
+    for file, (_, error) in zip(files, results):
+        if error is not None:
+            warnings.warn('ERROR: Could not read {}: {}'.format(file, error))
 
-    #Create a list of files which are not .doc
-    not_docs_or_docxs = [file for file in files if file not in docs_and_docxs]
+    dfs = [file_df.assign(filename=filename) for filename, (file_df, error) in zip(filenames, results) if error is None]
+    if not dfs:
+        return pd.DataFrame(columns=['filename','text','citations','headers'])
 
-    #Read each file depending on its extension and concatenate its content to the dataframe
-    for file in not_docs_or_docxs:
+    return pd.concat(dfs, ignore_index=True)
 
-        file_path = path + file
-        if file.endswith('.docx'):
-            file_df = read_docx(file_path)
-        elif file.endswith('.pptx'):
-            file_df = read_pptx(file_path)
-        else:
-            raise Exception('FILE EXTENSION NOT SUPPORTED: Only support .docx, .doc, .pdf and .pptx files')
-        
-        df = pd.concat([df,file_df], ignore_index=True)
-    return df
+def try_read_file(path, pdf_reader='native'):
+    """
+    Read a file and return its dataframe and None, or None and the error if it could not be read
+    """
+    try:
+        return read_file(path, pdf_reader), None
+    except Exception as error:
+        return None, error
 
-def read_database():
+def read_database(columns=None, filters=None, shards=None):
     """
-    Read the database, fix the lists and concatenate it to the new dataframe
+    Read the database, only the given columns, shards and the rows selected by the filters
     """
-    db = pd.read_csv('../data.csv')
-    db = get_lists(db)
+    db = read_documents(columns, filters, shards=shards)
 
     return db
 
 def read_urls(urls):
     """
-    Read the text of each hyperlink and concatenate it to the dataframe
+    Read the text of each hyperlink and concatenate it to the dataframe.
+    The processed pages are taken from the cache while they are fresh or the server says they did not change,
+    the rest are fetched at the same time and their sentences are processed together
     """
-    df = pd.DataFrame(columns=['url','corpus', 'processed_corpus'])
-    for url in urls:
-            try:
-                req = Request(
-                            url=url,
-                            headers={'User-Agent': 'Mozilla/5.0'})
-                html = urlopen(req).read()
-            except:
-                continue
-            soup = BeautifulSoup(html, features="html.parser")
+    urls = list(dict.fromkeys(urls))
+    page_cache = get_page_cache()
+    pages = page_cache.get(urls)
+
+    #Fetch the pages which are not cached or are not fresh, asking only for changes of the cached ones
+    stale = [url for url in urls if url not in pages or not pages[url]['fresh']]
+    responses = fetch_pages(stale, page_cache.validators(pages, stale))
+    metrics.count('urls.requested', len(stale))
+    metrics.count('urls.fetched', len(responses))
+
+    fetched = {}
+    for url in stale:
+        if url not in responses:
+            continue
+        status, headers, html = responses[url]
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+
+        #The page did not change, keep the cached one
+        if url in pages and (status == 304 or pages[url]['content_hash'] == content_hash(html)):
+            page_cache.refresh(url, etag, last_modified)
+            pages[url]['fresh'] = True
+        elif status == 200:
+            fetched[url] = (etag, last_modified, content_hash(html), get_corpus(html_to_text(html)))
+
+    processed_corpora = process_indexed_corpora([corpus for _, _, _, corpus in fetched.values()])
+    for (url, (etag, last_modified, page_hash, corpus)), processed_corpus in zip(fetched.items(), processed_corpora):
+        page_cache.set(url, etag, last_modified, page_hash, corpus, processed_corpus)
+        pages[url] = {'corpus': corpus, 'processed_corpus': processed_corpus, 'fresh': True}
+
+    #Keep the pages which could be read, in the order of the URLs. If a page could not be fetched again, the cached one is used
+    urls = [url for url in urls if url in pages]
+    df = pd.DataFrame({'url': urls, 'corpus': [pages[url]['corpus'] for url in urls], 'processed_corpus': [pages[url]['processed_corpus'] for url in urls]}, columns=['url','corpus', 'processed_corpus'])
 
-            #Kill all script and style elements
-            for script in soup(["script", "style"]):
-                script.extract()
+    return df
 
-            #Get text
-            text = soup.get_text()
+def html_to_text(html):
+    """
+    Return the visible text of an html page, with a sentence for each line
+    """
+    soup = BeautifulSoup(html, features="html.parser")
 
-            #Break into lines and remove leading and trailing space on each
-            lines = (line.strip() for line in text.splitlines())
-            
-            #Break multi-headlines into a line each
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    #Kill all script and style elements
+    for script in soup(["script", "style"]):
+        script.extract()
 
-            #Drop blank lines
-            text = '. '.join(chunk for chunk in chunks if chunk)
+    #Get text
+    text = soup.get_text()
 
-            #Remove special characters
-            text = clean_special_characters(text)
+    #Break into lines and remove leading and trailing space on each
+    lines = (line.strip() for line in text.splitlines())
+    
+    #Break multi-headlines into a line each
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
 
-            corpus = get_corpus(text)
-            processed_corpus = process_indexed_corpus(corpus)
-            
-            df = pd.concat([df, pd.DataFrame({'url':url,'corpus':[corpus], 'processed_corpus': [processed_corpus]}, index=[0])], ignore_index=True)
-            
-    return df    
+    #Drop blank lines
+    text = '. '.join(chunk for chunk in chunks if chunk)
+
+    #Remove special characters
+    text = clean_special_characters(text)
+
+    return text
 
 #---Type of file---------------------------------------------------------------------------------------------------------------
 
@@ -145,6 +194,43 @@ def read_docx(file):
     df = pd.DataFrame({'filename': path_to_filename(file), 'text': [text],'author':[names] if names else np.nan, 'citations': [hyperlinks] if hyperlinks else np.nan, 'headers': [headers] if headers else np.nan})
     return df
 
+def read_pdf(path):
+    """
+    Read a pdf file without converting it and return a dataframe like read_docx, with the file name, the text,
+    the names in tables, the citations and the headers
+    """
+    pdf = fitz.open(path)
+    hyperlinks = []
+    names = []
+    text = ""
+
+    #Each block of text is taken as a paragraph
+    pages = [page.get_text('blocks', sort=True) for page in pdf]
+    headers = get_pdf_margins(pdf, pages, top=True)
+    footers = get_pdf_margins(pdf, pages, top=False)
+
+    for number, (page, blocks) in enumerate(zip(pdf, pages)):
+        hyperlinks += [link['uri'] for link in page.get_links() if link.get('uri')]
+
+        #The authors are in the tables of the cover, so the (slow) table detection is not run on the rest of the pages
+        if number < TABLE_PAGES:
+            names += names_in_rows(table.extract() for table in page.find_tables().tables)
+
+        for block in blocks:
+            paragraph_text = block[4].strip()
+            if block[6] != 0 or paragraph_text in headers or paragraph_text in footers:
+                continue
+            hyperlinks += text_hyperlinks(paragraph_text)
+            text += paragraph_text + ' \n '
+    pdf.close()
+    text = clean_special_characters(text)
+
+    headers = [clean_special_characters(header) for header in headers]
+
+    hyperlinks = cleaning_citations(hyperlinks)
+    df = pd.DataFrame({'filename': path_to_filename(path), 'text': [text],'author':[names] if names else np.nan, 'citations': [hyperlinks] if hyperlinks else np.nan, 'headers': [headers] if headers else np.nan})
+    return df
+
 def read_pptx(path):
     """
     Read a pptx file and return a dataframe with the file name, the text and the citations
@@ -171,137 +257,31 @@ def read_pptx(path):
 
     return df
 
-def read_pdf_docs(docs, df, path):
-    """
-    Receive a list of .doc and .pdf files, convert them to .docx files and read them,
-    then concatenate the new dataframes of each new .docx file into a dataframe and return it
-    """
-
-    dot_docs = [doc for doc in docs if doc.endswith('.doc')]
-    dot_pdfs = [doc for doc in docs if doc.endswith('.pdf')]
-
-    #If there is a temporal folder, remove it
-    if os.path.isdir('./data_temp'):
-
-        #Remove the temporal folder and its files
-        shutil.rmtree('./data_temp')
-
-    os.mkdir('./data_temp/')    
-    os.mkdir('./data_temp/docs_files')
-    os.mkdir('./data_temp/pdfs_files')
-    os.mkdir('./data_temp/docxs_files')
-
-    #Move files into its temporal folders
-    for doc in dot_docs:
-        shutil.copy(path + doc, './data_temp/docs_files/')
-    for doc in dot_pdfs:
-        shutil.copy(path + doc, './data_temp/pdfs_files/')
-
-    try:
-
-        #Converting .doc files to .docx files and then to .pdf files
-        doc2docx('./data_temp/docs_files/', './data_temp/docxs_files/')
-        time.sleep(.5)
-        pdf2docx(dot_pdfs)
-        time.sleep(.5)
-
-        #Read each .pdf file and concatenate the dataframes
-        for file in os.listdir('./data_temp/docxs_files/'):
-            file_df = read_docx('./data_temp/docxs_files/'+file)
-            df = pd.concat([df,file_df], ignore_index=True)
-
-    except:
-
-        #Remove the temporal folder and its files
-        shutil.rmtree('./data_temp')
-        raise Exception('ERROR: Could not convert files to .pdf files and read them')
-
-    #Remove the temporal folder and its files
-    shutil.rmtree('./data_temp')
-
-    return df
-
 #---Convert--------------------------------------------------------------------------------------------------------------------
 
 def read_and_convert_file(path, df):
     """
-    Read and convert only one file with .doc or .pdf format
-    """
-    
-    if path.endswith('.doc'):
-        doc2docx(path, './temp.docx')
-    elif path.endswith('.pdf'):
-        cv = Converter(path)
-        cv.convert('./temp.pdf')
-        cv.close()
-    else:
-        raise Exception('ERROR: File format not supported')
-
-    file_df = read_docx('./temp.docx')
-    df = pd.concat([df,file_df], ignore_index=True)
-    os.remove('./temp.docx')
-
-    return df
-
-def read_and_convert_from_path(docs, df, path):
-    """
-    Receive a list of .doc and .pdf files, convert them to .docx files and read them,
-    then concatenate the new dataframes of each new .docx file into a dataframe and return it
+    Read and convert only one file with .doc or .pdf format.
+    The file is converted into its own temporal folder, so conversions running at the same time do not clobber each other
     """
+    with tempfile.TemporaryDirectory() as temp_folder:
+        docx_path = os.path.join(temp_folder, path_to_filename(path) + '.docx')
+
+        if path.endswith('.doc'):
+            doc2docx(path, docx_path)
+        elif path.endswith('.pdf'):
+            cv = Converter(path)
+            cv.convert(docx_path)
+            cv.close()
+        else:
+            raise Exception('ERROR: File format not supported')
 
-    dot_docs = [doc for doc in docs if doc.endswith('.doc')]
-    dot_pdfs = [doc for doc in docs if doc.endswith('.pdf')]
-
-    #If there is a temporal folder, remove it
-    if os.path.isdir('./data_temp'):
-
-        #Remove the temporal folder and its files
-        shutil.rmtree('./data_temp')
-
-    os.mkdir('./data_temp/')    
-    os.mkdir('./data_temp/docs_files')
-    os.mkdir('./data_temp/pdfs_files')
-    os.mkdir('./data_temp/docxs_files')
-
-    #Copy files into temporal folders
-    for doc in dot_docs:
-        shutil.copy(path + doc, './data_temp/docs_files/')
-    for doc in dot_pdfs:
-        shutil.copy(path + doc, './data_temp/pdfs_files/')
-
-    try:
-
-        #Converting .doc files to .docx files and then to .pdf files
-        doc2docx('./data_temp/docs_files/', './data_temp/docxs_files/')
-        time.sleep(.5)
-        pdf2docx(dot_pdfs)
-        time.sleep(.5)
-
-        #Read each .pdf file and concatenate the dataframes
-        for file in os.listdir('./data_temp/docxs_files/'):
-            file_df = read_docx('./data_temp/docxs_files/'+file)
-            df = pd.concat([df,file_df], ignore_index=True)
-
-    except:
-
-        #Remove the temporal folder and its files
-        shutil.rmtree('./data_temp')
-        raise Exception('ERROR: Could not convert files to .pdf files and read them')
+        file_df = read_docx(docx_path)
 
-    #Remove the temporal folder and its files
-    shutil.rmtree('./data_temp')
+    df = pd.concat([df,file_df], ignore_index=True)
 
     return df
 
-def pdf2docx(pdf_files):
-    filenames = [os.path.splitext(doc)[0] for doc in pdf_files]
-    path_docx = './data_temp/docxs_files/'
-    path_pdf = './data_temp/pdfs_files/'
-    for file in filenames:
-        cv = Converter(path_pdf + file + '.pdf')
-        cv.convert(path_docx + file + '.docx', multi_processing=True)
-        cv.close()
-
 #---Clean----------------------------------------------------------------------------------------------------------------------
 
 def cleaning_citations(strings):
@@ -334,20 +314,6 @@ def remove_section(string, list_sections):
         string = string.replace(section,'')
     return string
 
-def get_lists(df):
-    """
-    Converts lists represented as strings to lists
-    """
-    df.loc[df.citations.notnull(), 'citations'] = df[df.citations.notnull()]['citations'].apply(ast.literal_eval)
-    df.loc[df.author.notnull(), 'author'] = df[df.author.notnull()]['author'].apply(ast.literal_eval)
-    df.loc[df.headers.notnull(), 'headers'] = df[df.headers.notnull()]['headers'].apply(ast.literal_eval)
-    df['processed_corpus'] = df['processed_corpus'].apply(ast.literal_eval)
-
-    #Chek if it's not empty?? I really don't know what I tried to do here :/
-    df.loc[df.headers.notnull(), 'headers']=df[df.headers.notnull()].headers.apply(lambda x: [header for header in x if header])
-
-    return df
-
 #---Extract--------------------------------------------------------------------------------------------------------------------
 
 def text_hyperlinks(string):
@@ -372,16 +338,39 @@ def docx_hyperlinks(doc):
     return hyperlinks     
 
 def names_in_table(tables):
+    return names_in_rows([[cell.text for cell in row.cells] for row in table.rows] for table in tables)
+
+def names_in_rows(tables):
+    """
+    Receive tables as lists of rows with the text of each cell and return the names in the author columns
+    """
     names = []
-    for table in tables:
+    for rows in tables:
+        if not rows:
+            continue
         #Look if in the headers there is a synonym for author
-        for i, cell in enumerate(table.rows[0].cells):
-            if cell.text.lower() in author_synonyms:
+        for i, cell in enumerate(rows[0]):
+            if (cell or '').lower() in author_synonyms:
                 #Looking for names in the rows
-                for row in table.rows[1:]:
-                    names.append(row.cells[i].text)
+                for row in rows[1:]:
+                    if i < len(row) and row[i] is not None:
+                        names.append(row[i])
     return names
 
+def get_pdf_margins(pdf, pages, top=True, margin=0.1):
+    """
+    Return the blocks of text in the top (headers) or bottom (footers) margin of the pages
+    which are repeated in more than one page and at least in half of them
+    """
+    counts = {}
+    for page, blocks in zip(pdf, pages):
+        height = page.rect.height
+        texts = set(block[4].strip() for block in blocks if block[6] == 0 and (block[3] < height * margin if top else block[1] > height * (1 - margin)))
+        for text in texts:
+            counts[text] = counts.get(text, 0) + 1
+
+    return [text for text, count in counts.items() if text and count > 1 and count >= len(pages) / 2]
+
 def get_headers(doc):
     headers = []
     section = doc.sections[0]
@@ -0,0 +1,116 @@
+import threading
+
+from cache import LemmaCache, PageCache, SearchCache, DocumentCache, ResultsCache
+from index import TopicIndex, SentenceIndex, FingerprintIndex
+from vocabulary import Vocabulary
+from lsh import LSHIndex
+
+MODEL = 'es_core_news_lg'
+
+#Everything is loaded the first time it is used and then shared by all the modules
+loaded = {}
+lock = threading.RLock()
+
+
+def get(name, load):
+    """
+    Return the object registered with a name, loading it the first time
+    """
+    with lock:
+        if name not in loaded:
+            loaded[name] = load()
+        return loaded[name]
+
+def get_nlp():
+    """
+    Return the spacy model
+    """
+    def load():
+        import spacy
+        return spacy.load(MODEL)
+
+    return get('nlp', load)
+
+def get_lemma_cache():
+    """
+    Return the cache of the lemmas of the sentences
+    """
+    return get('lemma_cache', lambda: LemmaCache(get_nlp()))
+
+def get_page_cache():
+    """
+    Return the cache of the processed web pages
+    """
+    return get('page_cache', PageCache)
+
+def get_search_cache():
+    """
+    Return the cache of the URLs found by the searches of the topics
+    """
+    return get('search_cache', SearchCache)
+
+def get_document_cache():
+    """
+    Return the cache of the processed documents of the compared folders
+    """
+    return get('document_cache', DocumentCache)
+
+def get_results_cache():
+    """
+    Return the cache of the score tables of the checks
+    """
+    return get('results_cache', ResultsCache)
+
+def get_topic_index():
+    """
+    Return the inverted index of the topics of the stored documents
+    """
+    return get('topic_index', TopicIndex)
+
+def get_sentence_index():
+    """
+    Return the index of the hashes of the sentences of the stored documents
+    """
+    return get('sentence_index', SentenceIndex)
+
+def get_fingerprint_index():
+    """
+    Return the inverted index of the winnowed fingerprints of the stored documents
+    """
+    return get('fingerprint_index', FingerprintIndex)
+
+def get_lsh_index():
+    """
+    Return the locality-sensitive hashing index of the sentences of the stored documents
+    """
+    return get('lsh_index', LSHIndex)
+
+def get_vocabulary():
+    """
+    Return the shared vocabulary of the lemmas
+    """
+    return get('vocabulary', Vocabulary)
+
+def reset(keep=()):
+    """
+    Forget the loaded objects except the ones named in keep, so a forked process opens its own connections instead of
+    using the ones of its parent, and a process which changes its working directory opens the stores of the new one
+    """
+    with lock:
+        for name in [name for name in loaded if name not in keep]:
+            del loaded[name]
+
+def reset_indexes():
+    """
+    Forget the loaded indexes, so they are opened again with the documents stored since then by other processes
+    """
+    with lock:
+        for name in ['topic_index', 'sentence_index', 'fingerprint_index', 'lsh_index']:
+            loaded.pop(name, None)
+
+def cache_stats():
+    """
+    Return the hits, misses and hit rate of the caches used until now
+    """
+    with lock:
+        return {name: loaded[name].stats() for name in ['lemma_cache', 'page_cache', 'search_cache', 'document_cache', 'results_cache'] if name in loaded}
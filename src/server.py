@@ -0,0 +1,96 @@
+import os
+import json
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+#Number of checks running at the same time and waiting for a worker
+MAX_WORKERS = 2
+MAX_QUEUE = 16
+
+#Maximum size of an uploaded file
+MAX_UPLOAD = 50 * 1024 * 1024
+
+EXTENSIONS = ('.docx', '.doc', '.pdf', '.pptx')
+
+
+class CheckServer(ThreadingHTTPServer):
+    """
+    HTTP server which runs the checks of the uploaded files in a bounded pool of workers
+    """
+
+    def __init__(self, address, check, max_workers=MAX_WORKERS, max_queue=MAX_QUEUE):
+        super().__init__(address, CheckHandler)
+        self.check = check
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+class CheckHandler(BaseHTTPRequestHandler):
+    """
+    GET /health answers if the server is up.
+    POST /check?filename=<name> receives a file as the request body and answers with the similarities json
+    """
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/health':
+            return self.send_json(404, {'error': 'Not found'})
+        self.send_json(200, {'status': 'ok'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/check':
+            return self.send_json(404, {'error': 'Not found'})
+
+        filename = os.path.basename(parse_qs(url.query).get('filename', [''])[0])
+        if not filename.endswith(EXTENSIONS):
+            return self.send_json(400, {'error': 'FILE EXTENSION NOT SUPPORTED: Only support .docx, .doc, .pdf and .pptx files'})
+
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_UPLOAD:
+            return self.send_json(413, {'error': 'File too large'})
+        content = self.rfile.read(length)
+
+        #Refuse the request if all the workers are busy and the queue is full
+        if not self.server.slots.acquire(blocking=False):
+            return self.send_json(503, {'error': 'Server busy'})
+
+        try:
+            with tempfile.TemporaryDirectory() as temp_folder:
+                path = os.path.join(temp_folder, filename)
+                with open(path, 'wb') as file:
+                    file.write(content)
+                similarities = self.server.executor.submit(self.server.check, path).result()
+            self.send_json(200, similarities)
+        except Exception as error:
+            self.send_json(500, {'error': str(error)})
+        finally:
+            self.server.slots.release()
+
+    def send_json(self, status, content):
+        body = json.dumps(content, indent=4, sort_keys=True).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(check, host='127.0.0.1', port=8000, max_workers=MAX_WORKERS, max_queue=MAX_QUEUE):
+    """
+    Serve the checks until the process is stopped. check receives the path of a file and returns its similarities
+    """
+    server = CheckServer((host, port), check, max_workers, max_queue)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
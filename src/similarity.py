@@ -1,133 +1,439 @@
-from plagiarism_detection import threshold
-from helper import pd
-from topic import google_topic
+import json
+import heapq
+
+from helper import np
+from topic import google_topic, topic_overlaps
 from reader import read_urls
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from vectors import vectorize, document_vectors, shared_width
+from vocabulary import token_corpus
+from index import sentence_hashes
+from registry import get_vocabulary, get_sentence_index, get_lsh_index, get_search_cache
+from lsh import BANDS
+from itertools import groupby
+from scipy import sparse
+from metrics import metrics
+
+#Number of sentences of the analyzed file scored at once
+CHUNK_SIZE = 256
 
 
-def get_similarities(df, comparing_df):
+def web_similarities(df, similarities, threshold):
     """
-    Get similarities between the analyzed file and comparing files.
+    Get similarities between the analyzed file and the websites: its citations and the first results of googling its topic
     """
-    similarities = {}
+    similarities = {} if similarities is None else similarities
 
-    db_similarities(df[['corpus','processed_corpus']], comparing_df, similarities)
+    if isinstance(df.get('citations'), list):
+        with metrics.stage('get_similarities.citations'):
+            url_similarities(df[['corpus', 'processed_corpus']], df['citations'], similarities, threshold)
 
-    if df['citations'] == True:
-        url_similarities(df[['corpus', 'processed_corpus']], df['citations'], similarities)
-        
-    googled_topic_similarities(df[['corpus', 'processed_corpus']],df['topic'], similarities)
+    with metrics.stage('get_similarities.google'):
+        googled_topic_similarities(df[['corpus', 'processed_corpus']], df['topic'], similarities, threshold)
 
     return similarities
 
-def db_similarities(df, comparing_df, similarities):
+def db_similarities(df, comparing_df, similarities, threshold, vectors={}, lsh_bands=None):
     """
-    Look for similarities into the database
+    Look for similarities into the database.
+    The exact copies are looked up in the sentence index of the stored documents, and only the other sentences are scored.
+    The sentence vectors of the stored documents are taken from the vectors store instead of being computed again.
+    If lsh_bands is set, each sentence is scored only against its candidates in the LSH index of the stored documents
     """
-    unprocessed_corpus = df['corpus']
-    processed_corpus = df['processed_corpus']
-    
-    #Remove the index from the processed corpus
-    corpus = [slice[1] for slice in processed_corpus]
-    
-    #Iterate over the comparing dataframe
-    for _, row in comparing_df.iterrows():
-
-        row_unprocessed_corpus = row['corpus']
-        row_indexed_corpus = row['processed_corpus']
-        row_corpus = [slice[1] for slice in row_indexed_corpus]
-
-        #Create a vectorizer with the corpuses
-        vectorizer = CountVectorizer()
-        vectorizer.fit(row_corpus + corpus)
-
-        #Iterate over the analyzed file
-        for slice in processed_corpus:
-
-            index, sentence = slice
-            plagiarism = []
-
-            #Iterate over the comparing file
-            for row_slice in row_indexed_corpus:
-
-                row_index, row_sentence = row_slice
-
-                #Transform the sentences into vectors
-                vector = vectorizer.transform([row_sentence, sentence])
-
-                score = cosine_similarity(vector)[0][1]
-                if 0.95 > score > threshold:
-                    plagiarism.append({'plagiarized_sentence':row_unprocessed_corpus[row_index],
-                                       'plagiarism_score':score, 
-                                       'plagiarized_file':row['filename'],  
-                                       'plagiarized_author':row['author'] 
-                                      })
-            #Append the plagiarism to the dictionary if is not empty
-            if len(plagiarism) > 0:
-                append_to_dictionary(similarities, unprocessed_corpus[index], index, plagiarism)
-                    
-    return similarities
+    rows = comparing_df.to_dict('records')
+    row_vectors = [document_vectors(vectors, row['doc_id']) if row.get('doc_id') in vectors else vectorize(row['processed_corpus']) for row in rows]
+
+    metrics.count('database.documents', len(rows))
+    lsh = get_lsh_index() if lsh_bands else None
+    return find_similarities(df, rows, row_vectors, similarities, threshold, 0.95, database_plagiarism, get_sentence_index(), 'database', lsh, lsh_bands)
+
+def database_plagiarism(row, row_index, score):
+    """
+    Return the entry of a match with a sentence of a compared document
+    """
+    return {'plagiarized_sentence':row['corpus'][row_index],
+            'plagiarism_score':score,
+            'plagiarized_file':row['filename'],
+            'plagiarized_author':row['author']
+           }
 
-def url_similarities(df, urls, similarities):
+def url_similarities(df, urls, similarities, threshold):
     """
     Look for similarities into URLs
     """
-    unprocessed_corpus = df['corpus']
-    processed_corpus = df['processed_corpus']
     comparing_df = read_urls(urls)
+    rows = comparing_df.to_dict('records')
+    row_vectors = [vectorize(row['processed_corpus']) for row in rows]
+
+    def plagiarism(row, row_index, score):
+        return {'plagiarized_sentence':row['corpus'][row_index],
+                'plagiarism_score':score,
+                'plagiarized_website':row['url']
+               }
+
+    metrics.count('urls.read', len(rows))
+    return find_similarities(df, rows, row_vectors, similarities, threshold, 0.99, plagiarism, None, 'urls')
+
+def find_similarities(df, rows, row_vectors, similarities, lower, upper, plagiarism, index=None, name='database', lsh=None, bands=None):
+    """
+    Add to the similarities the exact copies of each sentence, with score 1.0, and the (lower, upper) scores
+    of the rest of the sentences against every sentence of the rows, or only against their candidates
+    if an LSH index is given. plagiarism builds the entry of each match
+    """
+    corpus = token_corpus(df['processed_corpus'], get_vocabulary())
+
+    #A ScoreTable records the scores of the copied sentences too, and hides them when it rebuilds the similarities
+    record = isinstance(similarities, ScoreTable)
+    if record:
+        similarities.start()
+
+    copies = exact_matches(corpus, rows, index)
+    for position, places in copies.items():
+        sentence_index = corpus[position][0]
+        add_similarities(similarities, df['corpus'][sentence_index], sentence_index, [plagiarism(row, row_index, 1.0) for row, row_index in places], places)
+
+    #Score every other sentence against every sentence of the rows at once
+    remaining = [position for position in range(len(corpus)) if record or position not in copies]
+    metrics.count(name + '.exact_sentences', len(copies))
+    if lsh is None:
+        matches = score_vectors(vectorize(corpus)[remaining], row_vectors, lower, upper)
+        metrics.count(name + '.sentence_pairs', len(remaining) * sum(matrix.shape[0] for matrix in row_vectors))
+    else:
+        matches = candidate_matches(corpus, remaining, rows, row_vectors, lower, upper, lsh, bands, name)
+    matches = ((row, remaining[position], row_position, score) for row, position, row_position, score in matches)
+
+    for sentence_index, matched in group_matches(df, rows, matches):
+        add_similarities(similarities, df['corpus'][sentence_index], sentence_index, [plagiarism(row, row_index, score) for row, row_index, score in matched], [(row, row_index) for row, row_index, _ in matched])
+
+    return similarities
+
+def exact_matches(corpus, rows, index=None):
+    """
+    Find the sentences of a processed corpus which are exact copies of sentences of the rows. The rows in the sentence index
+    are looked up with the hashes of the sentences, and the hashes of the rest are computed.
+    Return a dictionary with the position of each copied sentence as key and a list of (row, row sentence index) as value
+    """
+    hashes = sentence_hashes(corpus)
+    numbers = {row.get('doc_id'): number for number, row in enumerate(rows)}
+    indexed = index.documents() & numbers.keys() if index is not None else set()
+    found = {}
+
+    if indexed:
+        for sentence_hash, places in index.lookup(hashes).items():
+            found[sentence_hash] = [(numbers[doc_id], position) for doc_id, position in places if doc_id in indexed]
 
-    #Remove the index from the processed corpus
-    corpus = [slice[1] for slice in processed_corpus]
-    
-    #Iterate over the comparing dataframe
-    for _, row in comparing_df.iterrows():
-
-        row_unprocessed_corpus = row['corpus']
-        row_indexed_corpus = row['processed_corpus']
-        row_corpus = [slice[1] for slice in row_indexed_corpus]
-
-        #Create a vectorizer with the corpuses
-        vectorizer = CountVectorizer()
-        vectorizer.fit(row_corpus + corpus)
-
-        #Iterate over the analyzed file
-        for slice in processed_corpus:
-
-            index, sentence = slice
-            plagiarism = []
-
-            #Iterate over the comparing file
-            for row_slice in row_indexed_corpus:
-
-                row_index, row_sentence = row_slice
-
-                #Transform the sentences into vectors
-                vector = vectorizer.transform([row_sentence, sentence])
-
-                score = cosine_similarity(vector)[0][1]
-                if 0.99 > score > threshold:
-                    plagiarism.append({'plagiarized_sentence':row_unprocessed_corpus[row_index],
-                                      'plagiarism_score':score, 
-                                      'plagiarized_website':row['url'] 
-                                      })
-                    
-            #Append the plagiarism to the dictionary if is not empty
-            if len(plagiarism) > 0:
-                append_to_dictionary(similarities, unprocessed_corpus[index], index, plagiarism)
-                    
+    for number, row in enumerate(rows):
+        if row.get('doc_id') in indexed:
+            continue
+        for position, sentence_hash in enumerate(sentence_hashes(token_corpus(row['processed_corpus'], get_vocabulary()))):
+            found.setdefault(sentence_hash, []).append((number, position))
+
+    copies = {}
+    for position, sentence_hash in enumerate(hashes):
+        if found.get(sentence_hash):
+            copies[position] = [(rows[number], rows[number]['processed_corpus'][row_position][0]) for number, row_position in sorted(found[sentence_hash])]
+
+    return copies
+
+def candidate_matches(corpus, remaining, rows, row_vectors, lower, upper, lsh, bands=None, name='database'):
+    """
+    Score the remaining sentences of a processed corpus only against their candidates of the LSH index among the indexed rows,
+    and against every sentence of the rows which are not indexed.
+    Return the matches like score_vectors, with the position in remaining of each sentence
+    """
+    numbers = {row.get('doc_id'): number for number, row in enumerate(rows)}
+    indexed = lsh.documents() & numbers.keys()
+    others = [number for number, row in enumerate(rows) if row.get('doc_id') not in indexed]
+    vectors = vectorize(corpus)[remaining]
+
+    #Candidate pairs of (position in remaining, row, row position)
+    order = {position: i for i, position in enumerate(remaining)}
+    pairs = sorted((order[position], numbers[doc_id], row_position)
+                   for position, places in lsh.candidates(corpus, bands or BANDS).items() if position in order
+                   for doc_id, row_position in places if doc_id in indexed)
+
+    metrics.count(name + '.candidate_pairs', len(pairs))
+    metrics.count(name + '.sentence_pairs', len(pairs) + len(remaining) * sum(row_vectors[number].shape[0] for number in others))
+
+    matches = score_candidates(vectors, row_vectors, pairs, lower, upper)
+    other_matches = ((others[row], position, row_position, score) for row, position, row_position, score
+                     in score_vectors(vectors, [row_vectors[number] for number in others], lower, upper))
+    return heapq.merge(matches, other_matches, key=lambda match: (match[1], match[0], match[2]))
+
+def googled_topic_similarities(df, topic, similarities, threshold):
+    """
+    Google the file topic and get the first 3 URLs, then get the similarities.
+    The URLs found for a topic are taken from the search cache while they are fresh, so checking it again does not search it again
+    """
+    query = ' '.join(topic)
+    search_cache = get_search_cache()
+    urls = search_cache.get(query)
+    if urls is None:
+        urls = google_topic(topic)
+        #A failed search finds nothing, so it is not cached
+        if urls:
+            search_cache.set(query, urls)
+    return url_similarities(df, urls, similarities, threshold)
+
+def merge_similarities(similarities, results):
+    """
+    Add the similarities of each dictionary of a list, e.g. the ones found in each shard, in the order of the list.
+    The matches of each sentence in all of them are added at once, in the order of the sentences.
+    Return the dictionary, or the SimilarityStream where they are written
+    """
+    similarities = {} if similarities is None else similarities
+    if isinstance(similarities, ScoreTable):
+        similarities.merge(results)
+        return similarities
+
+    #A sentence copied exactly in any of them keeps only its exact copies, as when all the documents are scored together
+    copied = set(key for result in results for key, value in result.items() if any(plagiarism['plagiarism_score'] == 1.0 for plagiarism in value['plagiarism']))
+
+    merged = {}
+    for result in results:
+        for key, value in result.items():
+            element = [plagiarism for plagiarism in value['plagiarism'] if key not in copied or plagiarism['plagiarism_score'] == 1.0]
+            if element:
+                append_to_dictionary(merged, key, value['n_sentence'], element)
+
+    #A SimilarityStream writes a single line for each sentence
+    for key, value in sorted(merged.items(), key=lambda item: item[1]['n_sentence']):
+        add_similarities(similarities, key, value['n_sentence'], value['plagiarism'])
     return similarities
-    
-def googled_topic_similarities(df, topic):
+
+def add_similarities(similarities, key, index, element, places=None):
     """
-    Google the file topic and get the first 3 URLs, then get the similarities
+    Add the similarities of a sentence to the dictionary, or write them if similarities is a SimilarityStream,
+    or record them with the (row, row sentence index) of each match if it is a ScoreTable
     """
-    urls = google_topic(topic)
-    return url_similarities(df, urls)
+    if isinstance(similarities, ScoreTable):
+        similarities.write(index, element, places)
+    elif isinstance(similarities, SimilarityStream):
+        similarities.write(key, index, element)
+    else:
+        append_to_dictionary(similarities, key, index, element)
 
 def append_to_dictionary(dic, key, index, element):
     """
     If the key is not in the dictionary, add it, else append the element to the key
     """
     dic.setdefault(key, {'n_sentence': index, 'plagiarism': []})
-    dic[key]['plagiarism'] += element
\ No newline at end of file
+    dic[key]['plagiarism'] += element
+
+def file_counts(similarities):
+    """
+    Return the number of sentences with similarities in each plagiarized file
+    """
+    counts = {}
+    for sentence in similarities.values():
+        for plagiarized_file in set(plagiarism.get('plagiarized_file') for plagiarism in sentence['plagiarism']):
+            counts[plagiarized_file] = counts.get(plagiarized_file, 0) + 1
+    return counts
+
+
+class SimilarityStream:
+    """
+    Write the similarities of each sentence as a JSON line as soon as they are scored, keeping only the top_k
+    highest scores of each line. A sentence gets a line for the database and for each group of websites where it has similarities,
+    and top_k caps each line, not the sentence: the lines are written before the next group is scored. When the shards are scored
+    in a pool of processes, the lines of the database are written once every shard is scored.
+    Only the plagiarized files of each sentence are kept in memory, to count them before leaving out the lower scores
+    """
+
+    def __init__(self, file, top_k=None):
+        self.file = file
+        self.top_k = top_k
+        self.files = {}
+
+    def write(self, key, index, element):
+        self.files.setdefault(key, set()).update(plagiarism['plagiarized_file'] for plagiarism in element if 'plagiarized_file' in plagiarism)
+        if self.top_k:
+            element = sorted(element, key=lambda plagiarism: -plagiarism['plagiarism_score'])[:self.top_k]
+
+        self.file.write(json.dumps({'sentence': key, 'n_sentence': index, 'plagiarism': element}, sort_keys=True) + '\n')
+        self.file.flush()
+
+    def file_counts(self):
+        """
+        Return the number of sentences with similarities in each plagiarized file
+        """
+        counts = {}
+        for plagiarized_files in self.files.values():
+            for plagiarized_file in plagiarized_files:
+                counts[plagiarized_file] = counts.get(plagiarized_file, 0) + 1
+        return counts
+
+
+class ScoreTable:
+    """
+    Record every match of a check with the database scored above a threshold as a (sentence, document, row sentence, score) row,
+    with the number of topics each compared document has in common with the analyzed file. The similarities of any higher
+    threshold and closeness are rebuilt from it and the compared documents without scoring again.
+    The matches of each call of find_similarities are a section, where the exact copies of a sentence hide its other matches
+    like when they are scored. The matches with websites are not recorded, since the pages change: they are scored again on each check
+    """
+
+    #Version of the recorded sections, so the tables recorded by older versions are not replayed
+    VERSION = 3
+
+    def __init__(self, threshold, closeness, documents=None, sections=None, overlaps=None):
+        self.threshold = threshold
+        self.closeness = closeness
+        self.documents = documents or []
+        self.sections = sections or []
+        self.overlaps = overlaps or {}
+        self.numbers = {document: number for number, document in enumerate(self.documents)}
+        #The compared documents of the matches, by name. They are not written, so a table read from the cache has to load them
+        self.rows = {}
+
+    def start(self):
+        """
+        Start the section of a call of find_similarities
+        """
+        self.sections.append([])
+
+    def number(self, document):
+        """
+        Return the number of a compared document in the table, adding it the first time
+        """
+        if document not in self.numbers:
+            self.numbers[document] = len(self.documents)
+            self.documents.append(document)
+        return self.numbers[document]
+
+    def write(self, index, element, places):
+        """
+        Record the matches of a sentence with the (row, row sentence index) of each one
+        """
+        for plagiarism, (row, row_index) in zip(element, places):
+            document = document_name(row)
+            self.rows.setdefault(document, {'filename': row['filename'], 'author': row['author'], 'corpus': row['corpus']})
+            self.sections[-1].append([int(index), self.number(document), int(row_index), float(plagiarism['plagiarism_score'])])
+
+    def add_overlaps(self, topic, comparing_df):
+        """
+        Record the number of topics in common with the analyzed file of each compared document
+        """
+        for (_, row), overlap in zip(comparing_df.iterrows(), topic_overlaps(topic, comparing_df)):
+            self.overlaps[document_name(row)] = overlap
+
+    def merge(self, tables):
+        """
+        Add the sections of a list of tables, e.g. the ones of each shard, as one section
+        """
+        section = []
+        for table in tables:
+            numbers = [self.number(document) for document in table.documents]
+            section += [[index, numbers[document], row_index, score] for matches in table.sections for index, document, row_index, score in matches]
+            self.overlaps.update(table.overlaps)
+            self.rows.update(table.rows)
+        self.sections.append(section)
+
+    def replay(self, similarities, threshold, closeness, corpus):
+        """
+        Add to the similarities of an analyzed corpus the matches above a threshold in the documents with more than closeness topics
+        in common with it, as if they were scored with them. The compared documents of the matches must be in rows.
+        Return the dictionary or the SimilarityStream
+        """
+        similarities = {} if similarities is None else similarities
+        kept = [self.overlaps.get(document, 0) > closeness for document in self.documents]
+
+        for section in self.sections:
+            copied = set(index for index, document, _, score in section if score == 1.0 and kept[document])
+
+            #The matches of a sentence may be anywhere in a section, e.g. in the part of each shard, and they are added at once
+            sentences = {}
+            for index, document, row_index, score in section:
+                if kept[document] and (score == 1.0 or (index not in copied and score > threshold)):
+                    sentences.setdefault(index, []).append(database_plagiarism(self.rows[self.documents[document]], row_index, score))
+            for index, element in sentences.items():
+                add_similarities(similarities, corpus[index], index, element)
+
+        return similarities
+
+    def needed(self, closeness):
+        """
+        Return the names of the compared documents with more than closeness topics in common which are not in rows
+        """
+        return [document for document in self.documents if self.overlaps.get(document, 0) > closeness and document not in self.rows]
+
+    def to_dict(self):
+        """
+        Return the table as a dictionary which can be written as json
+        """
+        return {'threshold': self.threshold, 'closeness': self.closeness, 'documents': self.documents, 'sections': self.sections, 'overlaps': self.overlaps}
+
+    @classmethod
+    def from_dict(cls, table):
+        """
+        Build the table from the dictionary of to_dict
+        """
+        return cls(table['threshold'], table['closeness'], table['documents'], table['sections'], table['overlaps'])
+
+
+def document_name(row):
+    """
+    Return the id of the document of a row, or its file name if it is not stored
+    """
+    return row['doc_id'] if isinstance(row.get('doc_id'), str) else row.get('filename')
+
+
+#---Scoring engine---------------------------------------------------------------------------------------------------
+def score_vectors(vectors, comparing_vectors, lower, upper, chunk_size=CHUNK_SIZE):
+    """
+    Score each sentence vector against each sentence vector of a list of sparse matrices with one sparse matrix product
+    for each chunk of chunk_size sentences. The vectors are l2 normalized, so the product is the cosine similarity.
+    Yield (matrix, position, row_position, score) for the scores inside the (lower, upper) window,
+    sorted by position, matrix and row position, as soon as each chunk is scored
+    """
+    if not comparing_vectors or vectors.shape[0] == 0:
+        return
+
+    #The vectors of each document have as many columns as its highest lemma id
+    vectors, *comparing_vectors = shared_width([vectors] + comparing_vectors)
+    row_vectors = sparse.vstack(comparing_vectors, format='csr').T.tocsr()
+    offsets = np.cumsum([0] + [matrix.shape[0] for matrix in comparing_vectors])
+
+    for start in range(0, vectors.shape[0], chunk_size):
+        scores = (vectors[start:start + chunk_size] @ row_vectors).tocoo()
+
+        #Keep only the scores inside the threshold window
+        mask = (scores.data > lower) & (scores.data < upper)
+        positions, columns, chunk_scores = scores.row[mask] + start, scores.col[mask], scores.data[mask]
+
+        #Find which matrix each column belongs to
+        corpora = np.searchsorted(offsets, columns, side='right') - 1
+        order = np.lexsort((columns, corpora, positions))
+
+        for i in order:
+            yield int(corpora[i]), int(positions[i]), int(columns[i] - offsets[corpora[i]]), chunk_scores[i]
+
+def score_candidates(vectors, comparing_vectors, pairs, lower, upper):
+    """
+    Score only the pairs of (position, matrix, row_position) of sentence vectors, sorted by position, matrix and row position.
+    Return (matrix, position, row_position, score) for the scores inside the (lower, upper) window, in the same order
+    """
+    if not pairs:
+        return []
+
+    vectors, *comparing_vectors = shared_width([vectors] + comparing_vectors)
+    row_vectors = sparse.vstack(comparing_vectors, format='csr')
+    offsets = np.cumsum([0] + [matrix.shape[0] for matrix in comparing_vectors])
+
+    positions, corpora, row_positions = (np.array(column) for column in zip(*pairs))
+    scores = np.asarray(vectors[positions].multiply(row_vectors[offsets[corpora] + row_positions]).sum(axis=1)).ravel()
+    mask = (scores > lower) & (scores < upper)
+
+    return [(int(corpus), int(position), int(row_position), score) for position, corpus, row_position, score
+            in zip(positions[mask], corpora[mask], row_positions[mask], scores[mask])]
+
+def group_matches(df, rows, matches):
+    """
+    Group the scored matches by analyzed sentence.
+    Yield the sentence index and a list of (row, row sentence index, score)
+    """
+    processed_corpus = df['processed_corpus']
+
+    for position, group in groupby(matches, key=lambda match: match[1]):
+        index = processed_corpus[position][0]
+        plagiarism = [(rows[corpus], rows[corpus]['processed_corpus'][row_position][0], score) for corpus, _, row_position, score in group]
+        yield index, plagiarism
@@ -1,18 +1,14 @@
-from plagiarism_detection import closeness
-from helper import nlp
+from helper import pd
+from registry import get_topic_index
 from collections import Counter
-from processor import clean_sentences
 from googlesearch import search
 
 
-def get_topic(text):
+def get_topic_from_lemmas(lemmas):
     """
-    Get the most common words in a corpus
+    Get the 10 most common lemmas
     """
-    text = clean_sentences(text)
-    doc = nlp(text)
-    tokens = [token.lemma_.lower() for token in doc if not token.is_stop and token.pos_ != 'SPACE' and token.pos_ != 'PUNCT' and len(token.text)>1]
-    topic = Counter(tokens).most_common(10)
+    topic = Counter(lemmas).most_common(10)
     topic = [token[0] for token in topic]
     return topic
 
@@ -26,13 +22,34 @@ def google_topic(topic):
     urls = [url for url in search(query, num_results=3)][0:3]
     return urls
 
-def similar_topics(df, comparing_df):
+def topic_overlaps(topic, comparing_df):
     """
-    Compare the topics of two dataframes and return the ones that have more than x number of topics (closeness) in common
+    Return the number of topics in common with a topic of each document of a dataframe
+    """
+    return [len(set(x) & set(topic)) for x in comparing_df['topic']]
+
+def similar_topics(df, comparing_df, closeness, index=None):
+    """
+    Compare the topics of two dataframes and return the ones that have more than x number of topics (closeness) in common.
+    The stored documents are looked up in the topic index, only the others are compared one by one
     """
     topic = df['topic']
+    index = index or get_topic_index()
+
+    if comparing_df.empty:
+        return comparing_df
+
+    if 'doc_id' in comparing_df:
+        doc_ids = comparing_df['doc_id'].tolist()
+        documents, candidates = index.indexed(doc_ids), index.candidates(topic, closeness)
+        indexed = pd.Series([doc_id in documents for doc_id in doc_ids], index=comparing_df.index)
+        close = pd.Series([doc_id in candidates for doc_id in doc_ids], index=comparing_df.index)
+    else:
+        indexed = pd.Series(False, index=comparing_df.index)
+        close = pd.Series(False, index=comparing_df.index)
 
-    #Filtering by the intersection of topics
-    filtered_df = comparing_df[comparing_df['topic'].apply(lambda x: len(set(x) & set(topic)) > closeness)]
+    #Filtering by the intersection of topics the documents which are not indexed
+    if not indexed.all():
+        close[~indexed] = comparing_df.loc[~indexed, 'topic'].apply(lambda x: len(set(x) & set(topic)) > closeness)
 
-    return filtered_df
\ No newline at end of file
+    return comparing_df[close]
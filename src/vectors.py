@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import uuid
+import shutil
+
+from helper import np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+from registry import get_vocabulary
+from vocabulary import token_corpus, TRANSIENT_ID
+
+VECTORS_PATH = './vectors/'
+
+
+def vectorize(processed_corpus):
+    """
+    Return a sparse matrix with the l2 normalized vector of each sentence of a processed corpus.
+    The columns are the lemma ids of the vocabulary, so the lemma ids of a TokenCorpus are used as they are.
+    The matrices with transient lemma ids are very wide, see shared_width
+    """
+    corpus = token_corpus(processed_corpus, get_vocabulary())
+
+    if not len(corpus):
+        return sparse.csr_matrix((0, 1))
+
+    #Count each lemma id of each sentence
+    rows = np.repeat(np.arange(len(corpus)), np.diff(corpus.offsets))
+    width = int(corpus.tokens.max()) + 1 if len(corpus.tokens) else 1
+    matrix = sparse.csr_matrix((np.ones(len(corpus.tokens)), (rows, corpus.tokens)), shape=(len(corpus), width))
+
+    return normalize(matrix)
+
+def with_width(matrix, width):
+    """
+    Return a sparse matrix with more columns, sharing the arrays of the given one
+    """
+    return sparse.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], width))
+
+def shared_width(matrices):
+    """
+    Return the matrices with the same number of columns. The columns of the transient lemma ids, which only the
+    checked documents have, are moved right after the ones of the stored lemma ids, so the matrices stay narrow
+    """
+    wide = [matrix.shape[1] > TRANSIENT_ID for matrix in matrices]
+    if not any(wide):
+        width = max(matrix.shape[1] for matrix in matrices)
+        return [with_width(matrix, width) for matrix in matrices]
+
+    transient = np.unique(np.concatenate([matrix.indices[matrix.indices >= TRANSIENT_ID] for matrix, is_wide in zip(matrices, wide) if is_wide]))
+    stored = max(matrix.shape[1] if not is_wide else int(matrix.indices[matrix.indices < TRANSIENT_ID].max(initial=-1)) + 1 for matrix, is_wide in zip(matrices, wide))
+
+    narrow = []
+    for matrix, is_wide in zip(matrices, wide):
+        if is_wide:
+            indices = np.array(matrix.indices)
+            columns = indices >= TRANSIENT_ID
+            indices[columns] = stored + np.searchsorted(transient, indices[columns])
+            matrix = sparse.csr_matrix((matrix.data, indices, matrix.indptr), shape=matrix.shape)
+        narrow.append(with_width(matrix, stored + len(transient)))
+
+    return narrow
+
+def store_vectors(df, path=VECTORS_PATH):
+    """
+    Vectorize the processed corpus of the stored documents which are not in the vectors store yet, or whose version is newer
+    than the stored one, and save them as a new segment. The newest segment of a document is the one read.
+    Each segment is a sparse matrix saved as .npy arrays, so it can be memory-mapped when reading
+    """
+    stored = stored_versions(path)
+    versions = list(df['version']) if 'version' in df else [None] * len(df)
+    df = df.assign(version=versions)
+    df = df[[doc_id not in stored or newer(version, stored[doc_id]) for doc_id, version in zip(df['doc_id'], versions)]].drop_duplicates('doc_id', keep='last')
+
+    if df.empty:
+        return
+
+    matrices = [vectorize(processed_corpus) for processed_corpus in df['processed_corpus']]
+    width = max(matrix.shape[1] for matrix in matrices)
+    matrix = sparse.vstack([with_width(matrix, width) for matrix in matrices], format='csr')
+    offsets = np.cumsum([0] + [matrix.shape[0] for matrix in matrices])
+
+    #Write the segment into a hidden folder and rename it, so readers never see a half-written segment
+    os.makedirs(path, exist_ok=True)
+    segment = '{}-{}'.format(time.time_ns(), uuid.uuid4().hex[:8])
+    temp_folder = os.path.join(path, '.' + segment)
+    os.mkdir(temp_folder)
+
+    np.save(os.path.join(temp_folder, 'data.npy'), matrix.data)
+    np.save(os.path.join(temp_folder, 'indices.npy'), matrix.indices)
+    np.save(os.path.join(temp_folder, 'indptr.npy'), matrix.indptr)
+    np.save(os.path.join(temp_folder, 'offsets.npy'), offsets)
+    with open(os.path.join(temp_folder, 'doc_ids.json'), 'w') as doc_ids_file:
+        json.dump(list(df['doc_id']), doc_ids_file)
+    with open(os.path.join(temp_folder, 'versions.json'), 'w') as versions_file:
+        json.dump([None if version is None else int(version) for version in df['version']], versions_file)
+    with open(os.path.join(temp_folder, 'meta.json'), 'w') as meta_file:
+        json.dump({'features': 'vocabulary', 'width': width}, meta_file)
+
+    os.rename(temp_folder, os.path.join(path, segment))
+
+def read_vectors(path=VECTORS_PATH):
+    """
+    Memory-map every segment of the store and return a dictionary with the document id as key
+    and the segment arrays, the rows of the document and the number of columns as value
+    """
+    vectors = {}
+
+    if not os.path.isdir(path):
+        return vectors
+
+    for segment in sorted(os.listdir(path)):
+        if segment.startswith('.'):
+            continue
+
+        #Segments without meta.json were vectorized with hashed features and can not be compared with the lemma ids.
+        #Rebuilding the indexes (python src/index.py) vectorizes their documents again
+        folder = os.path.join(path, segment)
+        if not os.path.exists(os.path.join(folder, 'meta.json')):
+            continue
+        with open(os.path.join(folder, 'meta.json')) as meta_file:
+            width = json.load(meta_file)['width']
+
+        arrays = tuple(np.load(os.path.join(folder, name + '.npy'), mmap_mode='r') for name in ['data', 'indices', 'indptr'])
+        offsets = np.load(os.path.join(folder, 'offsets.npy'))
+        with open(os.path.join(folder, 'doc_ids.json')) as doc_ids_file:
+            doc_ids = json.load(doc_ids_file)
+
+        for doc_id, start, end in zip(doc_ids, offsets[:-1], offsets[1:]):
+            vectors[doc_id] = (arrays, start, end, width)
+
+    return vectors
+
+def stored_versions(path=VECTORS_PATH):
+    """
+    Return a dictionary with the id of each vectorized document as key and the version of its newest segment as value,
+    or None if the segment has no versions
+    """
+    versions = {}
+
+    if not os.path.isdir(path):
+        return versions
+
+    for segment in sorted(os.listdir(path)):
+        folder = os.path.join(path, segment)
+        if segment.startswith('.') or not os.path.exists(os.path.join(folder, 'meta.json')):
+            continue
+
+        with open(os.path.join(folder, 'doc_ids.json')) as doc_ids_file:
+            doc_ids = json.load(doc_ids_file)
+        segment_versions = [None] * len(doc_ids)
+        if os.path.exists(os.path.join(folder, 'versions.json')):
+            with open(os.path.join(folder, 'versions.json')) as versions_file:
+                segment_versions = json.load(versions_file)
+
+        versions.update(zip(doc_ids, segment_versions))
+
+    return versions
+
+def newer(version, stored_version):
+    """
+    Return True if a version of a document is newer than its stored version. Without versions, the stored one is kept
+    """
+    return version is not None and stored_version is not None and version > stored_version
+
+def remove_hashed_segments(path=VECTORS_PATH):
+    """
+    Remove the segments vectorized with hashed features (without meta.json), so their documents can be vectorized again
+    with the lemma ids. Return the number of removed segments
+    """
+    if not os.path.isdir(path):
+        return 0
+
+    segments = [segment for segment in os.listdir(path) if not segment.startswith('.') and not os.path.exists(os.path.join(path, segment, 'meta.json'))]
+    for segment in segments:
+        shutil.rmtree(os.path.join(path, segment))
+
+    return len(segments)
+
+def document_vectors(vectors, doc_id):
+    """
+    Return the sparse matrix with the sentence vectors of a stored document, or of a document vectorized in this run
+    """
+    if sparse.issparse(vectors[doc_id]):
+        return vectors[doc_id]
+
+    (data, indices, indptr), start, end, width = vectors[doc_id]
+    first, last = indptr[start], indptr[end]
+
+    return sparse.csr_matrix((data[first:last], indices[first:last], indptr[start:end + 1] - first), shape=(end - start, width))
@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+
+from helper import np
+from index import INDEX_PATH
+
+#Ids given to the lemmas which are not stored, from TRANSIENT_ID on. They are only kept in memory
+TRANSIENT_ID = 2**30
+
+
+class Vocabulary:
+    """
+    Shared vocabulary where each lemma is interned with an integer id, stored on disk (sqlite).
+    The ids never change, so they can be stored with the documents and used as the columns of the sentence vectors.
+    Only the lemmas of the stored documents are interned: the lemmas of the checked documents which are not stored
+    get transient ids, which are never written
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.connection = None
+        self.ids = {}
+        self.transient = {}
+        self.lemmas = {}
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Open the sqlite database the first time it is needed
+        """
+        if self.connection is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.connection = sqlite3.connect(os.path.join(self.path, 'vocabulary.sqlite'), check_same_thread=False)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS lemmas (id INTEGER PRIMARY KEY, lemma TEXT UNIQUE)')
+        return self.connection
+
+    def encode(self, lemmas, persist=False):
+        """
+        Return an array with the id of each lemma. The new lemmas are interned if persist is True,
+        and get a transient id otherwise. The lemmas with transient ids are looked up again, since another process may have interned them
+        """
+        with self.lock:
+            missing = list(dict.fromkeys(lemma for lemma in lemmas if lemma not in self.ids))
+
+            if missing:
+                connection = self.connect()
+                if persist:
+                    with connection:
+                        connection.executemany('INSERT OR IGNORE INTO lemmas (lemma) VALUES (?)', [(lemma,) for lemma in missing])
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    query = 'SELECT lemma, id FROM lemmas WHERE lemma IN ({})'.format(','.join('?' * len(chunk)))
+                    self.ids.update(connection.execute(query, chunk))
+
+                for lemma in missing:
+                    if lemma not in self.ids and lemma not in self.transient:
+                        self.transient[lemma] = TRANSIENT_ID + len(self.transient)
+                        self.lemmas[self.transient[lemma]] = lemma
+
+            return np.array([self.ids[lemma] if lemma in self.ids else self.transient[lemma] for lemma in lemmas], dtype=np.int32)
+
+    def decode(self, ids):
+        """
+        Return the lemma of each id
+        """
+        ids = [int(i) for i in ids]
+
+        with self.lock:
+            missing = list(set(i for i in ids if i not in self.lemmas))
+
+            connection = self.connect()
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                query = 'SELECT id, lemma FROM lemmas WHERE id IN ({})'.format(','.join('?' * len(chunk)))
+                self.lemmas.update(connection.execute(query, chunk))
+
+            return [self.lemmas[i] for i in ids]
+
+
+class TokenCorpus:
+    """
+    Processed corpus stored as integer arrays: the index of each kept sentence, the lemma ids of all the sentences
+    one after another and the offset where each sentence starts. An item is (index, lemma ids), like the
+    (index, processed sentence) tuples of the processed corpus of a web page
+    """
+
+    __slots__ = ('index', 'tokens', 'offsets')
+
+    def __init__(self, index, tokens, offsets):
+        self.index = index
+        self.tokens = tokens
+        self.offsets = offsets
+
+    @classmethod
+    def from_sentences(cls, sentences, vocabulary, persist=False):
+        """
+        Build the corpus from a list of (index, list of lemmas), interning the new lemmas if persist is True
+        """
+        index = np.array([i for i, _ in sentences], dtype=np.int32)
+        tokens = vocabulary.encode([lemma for _, lemmas in sentences for lemma in lemmas], persist)
+        offsets = np.cumsum([0] + [len(lemmas) for _, lemmas in sentences], dtype=np.int32)
+        return cls(index, tokens, offsets)
+
+    def sentences(self, vocabulary):
+        """
+        Return the corpus as a list of (index, processed sentence), like the processed corpus of a web page
+        """
+        lemmas = vocabulary.decode(self.tokens)
+        return [(int(i), ' '.join(lemmas[start:end])) for i, start, end in zip(self.index, self.offsets[:-1], self.offsets[1:])]
+
+    def transient(self):
+        """
+        Return True if any lemma has a transient id
+        """
+        return bool(len(self.tokens)) and int(self.tokens.max()) >= TRANSIENT_ID
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        return int(self.index[i]), self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __eq__(self, other):
+        return isinstance(other, TokenCorpus) and all(np.array_equal(getattr(self, name), getattr(other, name)) for name in self.__slots__)
+
+    def __repr__(self):
+        return 'TokenCorpus({} sentences, {} tokens)'.format(len(self.index), len(self.tokens))
+
+
+def token_corpus(processed_corpus, vocabulary, persist=False):
+    """
+    Return a processed corpus as a TokenCorpus, encoding it if it is a list of (index, processed sentence).
+    The new lemmas are interned if persist is True (when the documents are stored) and get transient ids otherwise.
+    The transient ids of a TokenCorpus are encoded again, so the lemmas interned since then get their stored ids
+    """
+    if isinstance(processed_corpus, TokenCorpus):
+        if not processed_corpus.transient():
+            return processed_corpus
+
+        transient = processed_corpus.tokens >= TRANSIENT_ID
+        ids = vocabulary.encode(vocabulary.decode(processed_corpus.tokens[transient]), persist)
+        if np.array_equal(ids, processed_corpus.tokens[transient]):
+            return processed_corpus
+
+        tokens = processed_corpus.tokens.copy()
+        tokens[transient] = ids
+        return TokenCorpus(processed_corpus.index, tokens, processed_corpus.offsets)
+
+    return TokenCorpus.from_sentences([(index, sentence.split()) for index, sentence in processed_corpus], vocabulary, persist)
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'src'), os.path.join(ROOT, 'benchmarks')]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Run a test in an empty folder, with a blank spacy model whose lemmas are the lowercase words and without googling the topics,
+    so the checks need neither the Spanish model nor the network. The metrics of the earlier tests are forgotten
+    """
+    import spacy
+    import registry
+    import processor
+    import similarity
+    from metrics import metrics
+
+    monkeypatch.chdir(tmp_path)
+    registry.reset()
+    metrics.reset()
+    registry.loaded['nlp'] = spacy.blank('es')
+    monkeypatch.setattr(processor, 'get_lemmas', lambda doc: [token.text.lower() for token in doc if token.is_alpha])
+    monkeypatch.setattr(similarity, 'google_topic', lambda topic: [])
+
+    yield tmp_path
+    registry.reset()
+
+
+@pytest.fixture
+def submissions(workdir):
+    """
+    Return the path of an analyzed submission and the folder of the submissions it is compared with
+    """
+    from generator import make_submissions
+
+    paths = make_submissions(str(workdir / 'submissions'), 5, 40, overlap=0.5, formats=['docx'])
+    os.makedirs(workdir / 'analyzed')
+    file_path = str(workdir / 'analyzed' / os.path.basename(paths[0]))
+    os.rename(paths[0], file_path)
+
+    return file_path, str(workdir / 'submissions')
@@ -0,0 +1,46 @@
+import os
+import json
+import shutil
+
+from plagiarism_detection import get_parser
+from detection import plagiarism_detection
+from database import read_documents
+
+
+def check(file_path, *arguments):
+    """
+    Check a file against the database and return its results.json
+    """
+    plagiarism_detection(file_path, get_parser().parse_args([file_path] + list(arguments)))
+    with open('results.json') as results_file:
+        return json.load(results_file)
+
+def exact_files(similarities):
+    """
+    Return the files with exact copies of the sentences
+    """
+    return set(plagiarism['plagiarized_file'] for value in similarities.values() for plagiarism in value['plagiarism'] if plagiarism['plagiarism_score'] == 1.0)
+
+
+def test_revised_file_replaces_its_draft(submissions, workdir):
+    file_path, comparing_path = submissions
+    draft, revision = sorted(os.path.join(comparing_path, name) for name in os.listdir(comparing_path))[:2]
+    os.makedirs('stored')
+    os.makedirs('checked')
+
+    #The draft and then the revision are stored with the same name
+    for path in [draft, revision]:
+        shutil.copy(path, os.path.join('stored', 'work.docx'))
+        check(os.path.join('stored', 'work.docx'), '-s', 'True')
+
+    stored = read_documents(['doc_id', 'filename'])
+    assert list(stored['filename']) == ['work']
+
+    #Only the sentences of the revision are found in the stored document
+    shutil.copy(draft, os.path.join('checked', 'draft.docx'))
+    shutil.copy(revision, os.path.join('checked', 'revision.docx'))
+    assert exact_files(check(os.path.join('checked', 'draft.docx'), '-t', '0.99', '-n', '0')) == set()
+    assert exact_files(check(os.path.join('checked', 'revision.docx'), '-t', '0.99', '-n', '0')) == {'work'}
+
+    #Checking the revision under its stored name does not compare it with its draft
+    assert check(os.path.join('stored', 'work.docx'), '-t', '0.5', '-n', '0') == {}
@@ -0,0 +1,83 @@
+import time
+import threading
+
+import pytest
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from fetcher import fetch_pages, fetch_urls
+
+#Seconds the slow pages take to answer, longer than the timeouts and deadlines of the tests
+SLOW = 3
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """
+    /page answers a short page, /slow answers after SLOW seconds, /large answers 1 MB, /missing answers 404
+    and /cached answers 304
+    """
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/slow':
+            time.sleep(SLOW)
+        if path == '/missing':
+            return self.answer(404, b'Not found')
+        if path == '/cached':
+            return self.answer(304, b'')
+        self.answer(200, b'x' * 1024 * 1024 if path == '/large' else b'page')
+
+    def answer(self, status, body):
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """
+    Serve the pages on a local port in a thread and return the base URL
+    """
+    http_server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    http_server.daemon_threads = True
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+
+    yield 'http://127.0.0.1:{}'.format(http_server.server_address[1])
+
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def test_fetch_page(server):
+    assert fetch_urls([server + '/page']) == {server + '/page': b'page'}
+
+def test_timeout_leaves_out_slow_page(server):
+    start = time.monotonic()
+    pages = fetch_urls([server + '/page', server + '/slow'], timeout=0.5)
+
+    assert pages == {server + '/page': b'page'}
+    assert time.monotonic() - start < SLOW
+
+def test_deadline_does_not_wait_for_running_requests(server):
+    start = time.monotonic()
+    pages = fetch_urls([server + '/page'] + [server + '/slow?{}'.format(i) for i in range(4)], timeout=10, deadline=0.5)
+
+    assert pages == {server + '/page': b'page'}
+    assert time.monotonic() - start < SLOW
+
+def test_max_bytes_truncates_content(server):
+    assert fetch_urls([server + '/large'], max_bytes=1000) == {server + '/large': b'x' * 1000}
+
+def test_unsuccessful_responses(server):
+    assert fetch_urls([server + '/missing']) == {}
+
+    pages = fetch_pages([server + '/missing', server + '/cached'])
+    assert list(pages) == [server + '/cached']
+    assert pages[server + '/cached'][0] == 304
+    assert pages[server + '/cached'][2] == b''
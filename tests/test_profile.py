@@ -0,0 +1,16 @@
+import json
+
+from plagiarism_detection import get_parser
+from detection import plagiarism_detection
+
+
+def test_analyzed_file_is_timed_apart(submissions):
+    file_path, comparing_path = submissions
+
+    plagiarism_detection(file_path, get_parser().parse_args([file_path, '-p', comparing_path, '--profile']))
+
+    with open('results.metrics.json') as metrics_file:
+        stages = json.load(metrics_file)['stages']
+
+    assert stages['read_file']['calls'] == 1
+    assert stages['read_path']['calls'] == 1
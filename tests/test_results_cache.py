@@ -0,0 +1,118 @@
+import os
+import json
+import shutil
+
+import pytest
+
+import registry
+import similarity
+from helper import pd
+from plagiarism_detection import get_parser
+from detection import plagiarism_detection, process_files
+
+
+def check(file_path, *arguments):
+    """
+    Check a file against the database and return its results.json
+    """
+    plagiarism_detection(file_path, get_parser().parse_args([file_path] + list(arguments)))
+    with open('results.json') as results_file:
+        return json.load(results_file)
+
+def forget_results():
+    """
+    Remove the results cache, so the next check is scored from scratch
+    """
+    registry.loaded.pop('results_cache', None)
+    os.remove(os.path.join('cache', 'results.sqlite'))
+
+
+@pytest.fixture
+def database(submissions):
+    """
+    Store the submissions in the database and return the path of the analyzed one
+    """
+    file_path, comparing_path = submissions
+    plagiarism_detection(file_path, get_parser().parse_args([file_path, '-p', comparing_path, '-s', 'True']))
+    return file_path
+
+
+@pytest.mark.parametrize('threshold, closeness', [('0.5', '0'), ('0.7', '0'), ('0.6', '1'), ('0.8', '2')])
+def test_replay_equals_fresh_check(database, threshold, closeness):
+    check(database, '-t', '0.9', '-n', '0', '--score_floor', '0.5')
+    replayed = check(database, '-t', threshold, '-n', closeness)
+    assert registry.get_results_cache().hits == 1
+
+    forget_results()
+    assert check(database, '-t', threshold, '-n', closeness) == replayed
+
+def test_replay_finds_matches(database):
+    check(database, '-t', '0.9', '-n', '0', '--score_floor', '0.5')
+    assert check(database, '-t', '0.5', '-n', '0')
+
+def test_websites_are_scored_again(database, monkeypatch):
+    file = process_files([database], get_parser().parse_args([database])).iloc[0]
+    copied = pd.DataFrame({'url': ['https://example.com'], 'corpus': [file['corpus']], 'processed_corpus': [file['processed_corpus'].sentences(registry.get_vocabulary())]})
+    pages = [copied]
+
+    monkeypatch.setattr(similarity, 'google_topic', lambda topic: ['https://example.com'])
+    monkeypatch.setattr(similarity, 'read_urls', lambda urls: pages[-1])
+
+    def websites(similarities):
+        return [plagiarism for value in similarities.values() for plagiarism in value['plagiarism'] if 'plagiarized_website' in plagiarism]
+
+    assert websites(check(database, '-t', '0.5', '-n', '0'))
+
+    #The page changed, so the cached check has no matches with it
+    pages.append(copied.iloc[:0])
+    assert not websites(check(database, '-t', '0.5', '-n', '0'))
+    assert registry.get_results_cache().hits == 1
+
+def test_replay_does_not_search_again(database, monkeypatch):
+    searches = []
+    monkeypatch.setattr(similarity, 'google_topic', lambda topic: searches.append(topic) or ['https://example.com'])
+    monkeypatch.setattr(similarity, 'read_urls', lambda urls: pd.DataFrame(columns=['url', 'corpus', 'processed_corpus']))
+
+    check(database, '-t', '0.5', '-n', '0')
+    check(database, '-t', '0.6', '-n', '0')
+    assert registry.get_results_cache().hits == 1
+    assert len(searches) == 1
+
+def test_table_keeps_only_scores(database):
+    check(database, '-t', '0.5', '-n', '0')
+
+    table = json.loads(registry.get_results_cache().connect().execute('SELECT scores FROM results').fetchone()[0])
+    matches = [match for section in table['sections'] for match in section]
+    assert matches
+    assert all(len(match) == 4 and all(isinstance(value, (int, float)) for value in match) for match in matches)
+    assert 'plagiarized_sentence' not in json.dumps(table)
+
+def test_replay_with_comparing_files_equals_fresh_check(submissions):
+    file_path, comparing_path = submissions
+    check(file_path, '-p', comparing_path, '-t', '0.9', '-n', '0', '--score_floor', '0.5')
+    replayed = check(file_path, '-p', comparing_path, '-t', '0.5', '-n', '0')
+    assert registry.get_results_cache().hits == 1
+    assert replayed
+
+    forget_results()
+    assert check(file_path, '-p', comparing_path, '-t', '0.5', '-n', '0') == replayed
+
+def test_sharded_replay_equals_fresh_check(database):
+    check(database, '-t', '0.9', '-n', '0', '--score_floor', '0.5', '--shard_workers', '2')
+    replayed = check(database, '-t', '0.6', '-n', '0', '--shard_workers', '2')
+
+    forget_results()
+    assert check(database, '-t', '0.6', '-n', '0') == replayed
+
+def test_copy_with_another_name_is_not_replayed(database):
+    check(database, '-t', '0.5', '-n', '0')
+
+    #The stored file is left out of its own check, but not of the check of its copy
+    copy_path = os.path.join(os.path.dirname(database), 'copy.docx')
+    shutil.copy(database, copy_path)
+    similarities = check(copy_path, '-t', '0.5', '-n', '0')
+
+    assert similarities
+    assert registry.get_results_cache().hits == 0
+    assert all(any(plagiarism['plagiarized_file'] == 'submission_0000' and plagiarism['plagiarism_score'] == 1.0 for plagiarism in value['plagiarism'])
+               for value in similarities.values())
@@ -0,0 +1,75 @@
+import os
+import json
+import sys
+import shutil
+import subprocess
+
+import pytest
+
+import detection
+
+from plagiarism_detection import get_parser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#Stores a file from another process, with the same blank model and lemmas as the workdir fixture
+STORE = """
+import sys
+sys.path[:0] = {path!r}
+import spacy, registry, processor, similarity
+registry.loaded['nlp'] = spacy.blank('es')
+processor.get_lemmas = lambda doc: [token.text.lower() for token in doc if token.is_alpha]
+similarity.google_topic = lambda topic: []
+from plagiarism_detection import get_parser
+from detection import plagiarism_detection
+plagiarism_detection({file_path!r}, get_parser().parse_args([{file_path!r}, '-s', 'True']))
+"""
+
+
+def serve_check(options, monkeypatch):
+    """
+    Return the function which checks each file sent to the server, without serving it
+    """
+    checks = []
+    monkeypatch.setattr(detection, 'serve', lambda check, *arguments: checks.append(check))
+    detection.serve_detection(options)
+    return checks[0]
+
+def store_from_another_process(file_path):
+    """
+    Store a file in the database of the working directory from a new process
+    """
+    subprocess.run([sys.executable, '-c', STORE.format(path=[ROOT, os.path.join(ROOT, 'src')], file_path=file_path)], check=True, capture_output=True)
+
+
+def test_server_finds_copies_stored_by_another_process(submissions, monkeypatch):
+    file_path, _ = submissions
+    check = serve_check(get_parser().parse_args(['--serve', '-t', '0.5', '-n', '0']), monkeypatch)
+
+    #The lemmas of the file are not stored yet, so the server gives them transient ids
+    assert check(file_path) == {}
+
+    copy_path = os.path.join(os.path.dirname(file_path), 'copy.docx')
+    shutil.copy(file_path, copy_path)
+    store_from_another_process(copy_path)
+
+    similarities = check(file_path)
+    assert similarities
+    assert all(plagiarism['plagiarized_file'] == 'copy' and plagiarism['plagiarism_score'] == 1.0
+               for value in similarities.values() for plagiarism in value['plagiarism'])
+
+def test_server_keeps_the_database_loaded(submissions, monkeypatch):
+    file_path, comparing_path = submissions
+    stored_path = os.path.join(comparing_path, sorted(os.listdir(comparing_path))[0])
+    detection.plagiarism_detection(stored_path, get_parser().parse_args([stored_path, '-p', comparing_path, '-s', 'True']))
+    detection.plagiarism_detection(file_path, get_parser().parse_args([file_path, '-t', '0.5', '-n', '0']))
+    with open('results.json') as results_file:
+        expected = json.load(results_file)
+
+    check = serve_check(get_parser().parse_args(['--serve', '-t', '0.5', '-n', '0']), monkeypatch)
+
+    #The database did not change, so the candidates are taken from memory
+    monkeypatch.setattr(detection, 'read_database', lambda *arguments, **keywords: pytest.fail('The database was read again'))
+
+    assert expected
+    assert json.loads(json.dumps(check(file_path))) == expected
@@ -0,0 +1,77 @@
+import os
+import json
+import shutil
+
+import pytest
+import registry
+
+from docx import Document
+from plagiarism_detection import get_parser
+from detection import plagiarism_detection, cohort_detection
+
+
+def sorted_similarities(similarities):
+    """
+    Return the similarities with the matches of each sentence sorted, since the shards are merged in another order
+    """
+    return {key: dict(value, plagiarism=sorted(value['plagiarism'], key=lambda plagiarism: json.dumps(plagiarism, sort_keys=True)))
+            for key, value in similarities.items()}
+
+def check(file_path, *arguments):
+    """
+    Check a file from scratch, without the score tables of the earlier checks
+    """
+    registry.loaded.pop('results_cache', None)
+    if os.path.exists(os.path.join('cache', 'results.sqlite')):
+        os.remove(os.path.join('cache', 'results.sqlite'))
+    plagiarism_detection(file_path, get_parser().parse_args([file_path] + list(arguments)))
+
+def stream_lines(path):
+    """
+    Return the JSON lines of a stream
+    """
+    with open(path) as results_file:
+        return [json.loads(line) for line in results_file]
+
+
+@pytest.fixture
+def sharded(submissions, workdir):
+    """
+    Store some of the submissions in the shards of the database and leave the rest, with a copy of the first paragraphs
+    of the analyzed file, as the comparing files. Return the path of the analyzed file and of the comparing files
+    """
+    file_path, comparing_path = submissions
+    os.makedirs('stored')
+    for name in sorted(os.listdir(comparing_path))[:3]:
+        shutil.move(os.path.join(comparing_path, name), 'stored')
+    cohort_detection('stored', get_parser().parse_args(['stored', '-c', '-s', 'True', '-o', 'cohort']))
+
+    document = Document(file_path)
+    for paragraph in document.paragraphs[4:]:
+        paragraph._element.getparent().remove(paragraph._element)
+    document.save(os.path.join(comparing_path, 'copy.docx'))
+
+    return file_path, comparing_path
+
+
+def test_sharded_check_equals_unsharded_check(sharded):
+    file_path, comparing_path = sharded
+    results = []
+
+    for arguments in [[], ['--shard_workers', '2']]:
+        check(file_path, '-p', comparing_path, '-t', '0.5', '-n', '0', '--stream', '-k', '3', *arguments)
+        lines = stream_lines('results.jsonl')
+        assert len(set(line['sentence'] for line in lines)) == len(lines)
+        results.append(sorted_similarities({line['sentence']: {'n_sentence': line['n_sentence'], 'plagiarism': line['plagiarism']} for line in lines}))
+
+        check(file_path, '-p', comparing_path, '-t', '0.5', '-n', '0', *arguments)
+        with open('results.json') as results_file:
+            results.append(sorted_similarities(json.load(results_file)))
+
+    stream, similarities, sharded_stream, sharded_similarities = results
+    files = set(plagiarism['plagiarized_file'] for value in similarities.values() for plagiarism in value['plagiarism'])
+
+    assert {'copy', 'submission_0001'} <= files
+    assert any(plagiarism['plagiarism_score'] == 1.0 for value in similarities.values() for plagiarism in value['plagiarism'])
+    assert sharded_similarities == similarities
+    assert sharded_stream == stream
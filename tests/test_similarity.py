@@ -0,0 +1,117 @@
+import pytest
+
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+import registry
+import similarity
+
+from helper import pd
+from generator import make_database
+from similarity import db_similarities
+from index import SentenceIndex, store_sentences
+from registry import get_vocabulary
+from vocabulary import token_corpus
+
+
+def reference_similarities(query, db, threshold):
+    """
+    Score every sentence of the query against every sentence of each document with a vectorizer fitted on both,
+    like db_similarities did before the batched engine. A sentence copied exactly keeps only its exact copies
+    """
+    corpus = [sentence for _, sentence in query['processed_corpus']]
+    exact, fuzzy = {}, {}
+
+    for _, row in db.iterrows():
+        row_corpus = [row_sentence for _, row_sentence in row['processed_corpus']]
+        vectorizer = CountVectorizer().fit(row_corpus + corpus)
+        scores = cosine_similarity(vectorizer.transform(corpus), vectorizer.transform(row_corpus))
+
+        for position, (index, sentence) in enumerate(query['processed_corpus']):
+            for row_position, (row_index, row_sentence) in enumerate(row['processed_corpus']):
+                plagiarism = (row['filename'], row['corpus'][row_index])
+                if row_sentence == sentence:
+                    exact.setdefault(index, []).append(plagiarism + (1.0,))
+                elif 0.95 > scores[position, row_position] > threshold:
+                    fuzzy.setdefault(index, []).append(plagiarism + (scores[position, row_position],))
+
+    return {query['corpus'][index]: (index, exact.get(index) or fuzzy[index]) for index in sorted(exact.keys() | fuzzy.keys())}
+
+
+@pytest.mark.parametrize('threshold', [0.5, 0.7])
+def test_batched_scores_equal_pairwise_scores(workdir, threshold):
+    query, db = make_database(30, 20, overlap=0.5, copied=0.3)
+    query = pd.Series(query)
+
+    similarities = db_similarities(query, db, {}, threshold)
+    expected = reference_similarities(query, db, threshold)
+
+    assert expected
+    assert similarities.keys() == expected.keys()
+    for sentence, (index, matches) in expected.items():
+        assert similarities[sentence]['n_sentence'] == index
+        found = [(plagiarism['plagiarized_file'], plagiarism['plagiarized_sentence'], plagiarism['plagiarism_score']) for plagiarism in similarities[sentence]['plagiarism']]
+        assert [match[:2] for match in found] == [match[:2] for match in matches]
+        assert [match[2] for match in found] == pytest.approx([match[2] for match in matches])
+
+
+@pytest.fixture
+def copied_database(workdir):
+    """
+    Return a query and a database where the first document has the first sentence of the query verbatim
+    and the second document has it with one word changed
+    """
+    query, db = make_database(10, 20)
+    index, sentence = query['processed_corpus'][0]
+
+    for number, words in [(0, sentence.split()), (1, sentence.split()[:-1] + ['otra'])]:
+        row_index, _ = db.at[number, 'processed_corpus'][0]
+        db.at[number, 'corpus'] = [' '.join(words).capitalize()] + db.at[number, 'corpus'][1:]
+        db.at[number, 'processed_corpus'] = [(row_index, ' '.join(words))] + db.at[number, 'processed_corpus'][1:]
+
+    db['processed_corpus'] = [token_corpus(processed_corpus, get_vocabulary(), persist=True) for processed_corpus in db['processed_corpus']]
+    return pd.Series(query), db
+
+def scored_sentences(monkeypatch):
+    """
+    Record the number of sentences of the query scored with cosine similarity in each call of score_vectors
+    """
+    scored = []
+    score_vectors = similarity.score_vectors
+
+    def spy(vectors, *arguments):
+        scored.append(vectors.shape[0])
+        return score_vectors(vectors, *arguments)
+
+    monkeypatch.setattr(similarity, 'score_vectors', spy)
+    return scored
+
+def test_exact_copy_is_found_in_the_sentence_index(copied_database, monkeypatch):
+    query, db = copied_database
+    store_sentences(db)
+    scored = scored_sentences(monkeypatch)
+
+    lookups = []
+    lookup = SentenceIndex.lookup
+    monkeypatch.setattr(SentenceIndex, 'lookup', lambda self, hashes: lookups.append(hashes) or lookup(self, hashes))
+
+    similarities = db_similarities(query, db, {}, 0.5)
+    copied = similarities[query['corpus'][query['processed_corpus'][0][0]]]['plagiarism']
+
+    assert lookups
+    assert [(plagiarism['plagiarized_file'], plagiarism['plagiarism_score']) for plagiarism in copied] == [(db.at[0, 'filename'], 1.0)]
+    assert scored == [len(query['processed_corpus']) - 1]
+
+def test_exact_copy_is_found_without_the_sentence_index(copied_database, monkeypatch):
+    query, db = copied_database
+    scored = scored_sentences(monkeypatch)
+    unindexed = db_similarities(query, db, {}, 0.5)
+    copied = unindexed[query['corpus'][query['processed_corpus'][0][0]]]['plagiarism']
+
+    assert [(plagiarism['plagiarized_file'], plagiarism['plagiarism_score']) for plagiarism in copied] == [(db.at[0, 'filename'], 1.0)]
+    assert scored == [len(query['processed_corpus']) - 1]
+
+    #The sentence index is opened again, so it knows the stored documents
+    store_sentences(db)
+    registry.loaded.pop('sentence_index', None)
+    assert db_similarities(query, db, {}, 0.5) == unindexed
@@ -0,0 +1,29 @@
+import sys
+import json
+import subprocess
+
+from startup import time_command, ROOT_PATH
+
+#Seconds allowed to show the help and to import the pipeline in a new process. Loading the model takes far longer
+HELP_BUDGET = 1.0
+IMPORT_BUDGET = 5.0
+
+IMPORT = 'import sys; sys.path.insert(0, "src"); import detection'
+
+
+def test_help_within_budget():
+    assert time_command(['plagiarism_detection.py', '--help'], repeat=1) < HELP_BUDGET
+
+def test_import_within_budget():
+    assert time_command(['-c', IMPORT], repeat=1) < IMPORT_BUDGET
+
+def test_import_does_not_load_the_model():
+    code = IMPORT + '; import json, registry; print(json.dumps({"modules": sorted(sys.modules), "loaded": sorted(registry.loaded)}))'
+
+    #The report is the last line, after the warnings printed by the imported modules
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT_PATH, check=True, capture_output=True, text=True).stdout
+    output = json.loads(output.splitlines()[-1])
+
+    assert 'spacy' not in output['modules']
+    assert not any(module.startswith('es_core_news') for module in output['modules'])
+    assert 'nlp' not in output['loaded']
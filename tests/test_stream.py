@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from plagiarism_detection import get_parser
+from detection import plagiarism_detection
+
+
+def merge_lines(path):
+    """
+    Merge the JSON lines of each sentence into the similarities of results.json
+    """
+    similarities = {}
+    with open(path) as results_file:
+        for line in results_file:
+            entry = json.loads(line)
+            sentence = similarities.setdefault(entry['sentence'], {'n_sentence': entry['n_sentence'], 'plagiarism': []})
+            sentence['plagiarism'] += entry['plagiarism']
+    return similarities
+
+
+def test_merged_stream_equals_results(submissions):
+    file_path, comparing_path = submissions
+
+    plagiarism_detection(file_path, get_parser().parse_args([file_path, '-p', comparing_path, '-t', '0.5', '-n', '0', '--stream']))
+    plagiarism_detection(file_path, get_parser().parse_args([file_path, '-p', comparing_path, '-t', '0.5', '-n', '0']))
+
+    with open('results.json') as results_file:
+        similarities = json.load(results_file)
+
+    assert similarities
+    assert merge_lines('results.jsonl') == similarities
+
+
+def test_top_k_caps_each_line(submissions):
+    file_path, comparing_path = submissions
+
+    plagiarism_detection(file_path, get_parser().parse_args([file_path, '-p', comparing_path, '-t', '0.5', '-n', '0', '--stream', '-k', '1']))
+
+    with open('results.jsonl') as results_file:
+        lines = [json.loads(line) for line in results_file]
+
+    assert lines
+    assert all(len(line['plagiarism']) == 1 for line in lines)
+
+
+@pytest.mark.parametrize('top_k', ['0', '-1'])
+def test_top_k_must_be_positive(top_k):
+    with pytest.raises(SystemExit):
+        get_parser().parse_args(['file.docx', '--stream', '-k', top_k])